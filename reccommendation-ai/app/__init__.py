@@ -4,10 +4,12 @@ from .middlewares import TokenMiddleware
 from .config import Config
 from celery import Celery
 from celery.schedules import crontab
+from redis import Redis
 
 
 app = Flask(__name__)
 mongo = PyMongo()
+redis_client = Redis.from_url(Config.REDIS_URL)
 
 def create_app():    
     # Load configuration
@@ -15,23 +17,47 @@ def create_app():
 
     # Initialize MongoDB
     mongo.init_app(app)
+    ensure_indexes()
 
     # Initialize Celery with app context
     celery = make_celery(app)
+    app.extensions['celery'] = celery
     
     app.wsgi_app = TokenMiddleware(app.wsgi_app)
 
     # Register blueprints (routes)
     register_blueprints(app)
+    register_commands(app)
 
     return app, celery  # Return both the Flask app and Celery instance
 
 
+def ensure_indexes():
+    from .models import ensure_indexes as ensure_model_indexes
+    try:
+        failures = ensure_model_indexes()
+    except Exception as e:
+        # fail silently, serving works without them and the next start retries
+        print(f"Failed to ensure MongoDB indexes: {e}")
+        return
+
+    for index, error in failures:
+        print(f"Failed to build index {index}, see `flask indexes ensure --dedupe`: {error}")
+
+
 def register_blueprints(app):
     # Import and register all Blueprints
     from .routes import recommendation_bp
     app.register_blueprint(recommendation_bp, url_prefix='/ai')
+
+
+def register_commands(app):
+    from .commands import models_cli, interactions_cli, indexes_cli
+    app.cli.add_command(models_cli)
+    app.cli.add_command(interactions_cli)
+    app.cli.add_command(indexes_cli)
     
+
 def make_celery(app):
     celery = Celery()
     celery.config_from_object(Config)
@@ -40,19 +66,28 @@ def make_celery(app):
     celery.conf.beat_schedule = {
         'train_category_model_task_midnight': {
             'task': 'train_category_model_task',
-            'schedule': crontab(hour=0, minute=0),  # Run at midnight every day
+            'schedule': crontab(hour=0, minute=0),  # Full refit at midnight every day
+            'kwargs': {'full': True},
         },
         'train_category_model_task_30': {
             'task': 'train_category_model_task',
-            'schedule': 30,
+            'schedule': Config.CATEGORY_TRAINING_INTERVAL,
+            'options': {'expires': Config.CATEGORY_TRAINING_INTERVAL},
         },
         'train_interaction_model_task_midnight': {
             'task': 'train_interaction_model_task',
-            'schedule': crontab(hour=1, minute=0),  # Run at midnight every day
+            'schedule': crontab(hour=1, minute=0),  # Full rebuild at 1am every day
+            'kwargs': {'full': True},
         },
         'train_interaction_model_task_30': {
             'task': 'train_interaction_model_task',
-            'schedule': 35,
+            'schedule': Config.INTERACTION_TRAINING_INTERVAL,
+            'options': {'expires': Config.INTERACTION_TRAINING_INTERVAL},
+        },
+        'train_als_model_task_hourly': {
+            'task': 'train_als_model_task',
+            'schedule': Config.ALS_TRAINING_INTERVAL,
+            'options': {'expires': Config.ALS_TRAINING_INTERVAL},
         },
     }
 
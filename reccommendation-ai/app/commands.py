@@ -0,0 +1,81 @@
+import click
+from flask.cli import AppGroup
+
+from app.config import Config
+from app.services import artifacts
+
+models_cli = AppGroup('models', help='Manage trained model artifacts.')
+interactions_cli = AppGroup('interactions', help='Ingest interaction events.')
+indexes_cli = AppGroup('indexes', help='Manage MongoDB indexes.')
+
+
+@models_cli.command('versions')
+@click.argument('name')
+def list_model_versions(name):
+    """List the retained versions of model NAME, marking the current one."""
+    current = artifacts.current_version(name)
+    for version in artifacts.list_versions(name):
+        manifest = artifacts.load_manifest(name, version) or {}
+        marker = '*' if version == current else ' '
+        click.echo(f"{marker} {version}  {manifest.get('mode', '')}  {manifest.get('created_at', '')}")
+
+
+@models_cli.command('rollback')
+@click.argument('name')
+@click.option('--version', default=None, help='Version to serve, defaults to the one before current.')
+def rollback_model(name, version):
+    """Point model NAME at an earlier version, serving workers pick it up on their next check."""
+    try:
+        version = artifacts.rollback(name, version)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{name} now serves version {version}")
+
+
+@interactions_cli.command('consume')
+@click.option('--consumer', default=None, help='Consumer name in the group, defaults to host and pid.')
+@click.option('--batch-size', type=int, default=None, help='Stream entries read and written per batch.')
+def consume_interactions(consumer, batch_size):
+    """Persist interaction events from the Redis stream, run one per consumer process."""
+    from app.streams import consume_interactions as consume, default_consumer_name
+
+    consumer = consumer or default_consumer_name()
+    click.echo(f"Consuming {Config.INTERACTION_STREAM} as {consumer}")
+    consume(consumer, batch_size)
+
+
+@interactions_cli.command('rebuild-counters')
+@click.option('--after', type=click.DateTime(), default=None, help='Count events created at or after this UTC time.')
+@click.option('--before', type=click.DateTime(), default=None, help='Count events created before this UTC time.')
+def rebuild_counters(after, before):
+    """
+    Add the retained raw events of a window to the pair counters.
+
+    Counts are added, never replaced, so pairs keep the views whose raw
+    events the INTERACTION_RETENTION_DAYS TTL already deleted. Events in the
+    window that were already counted are counted twice: pass the window of
+    the uncounted events, such as those stored before the counters existed
+    or by a batch whose counter update failed. Counters do not move their
+    last_seen for older events, so retrain with full=True afterwards.
+    """
+    from app.models import rebuild_interaction_counters
+
+    rebuild_interaction_counters(after, before)
+    click.echo("Interaction counters rebuilt.")
+
+
+@indexes_cli.command('ensure')
+@click.option('--dedupe', is_flag=True, help='Delete duplicate products first, keeping the latest write of each.')
+def ensure_indexes(dedupe):
+    """Create the indexes the app relies on, they are also ensured at startup."""
+    from app.models import dedupe_products, ensure_indexes as ensure
+
+    if dedupe:
+        click.echo(f"Removed {dedupe_products()} duplicate products.")
+
+    failures = ensure()
+    for index, error in failures:
+        click.echo(f"Failed to build index {index}: {error}", err=True)
+    if failures:
+        raise click.ClickException("Some indexes could not be built.")
+    click.echo("Indexes are up to date.")
@@ -15,6 +15,82 @@ class Config:
     accept_content = ['json']
     timezone = 'Asia/Kolkata'
     enable_utc = True
+    # Training runs on its own queue so it cannot starve other work
+    task_routes = {
+        'train_category_model_task': {'queue': 'training'},
+        'train_interaction_model_task': {'queue': 'training'},
+        'train_als_model_task': {'queue': 'training'},
+    }
+    worker_prefetch_multiplier = 1
+    
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/1')
+    
+    # Page size of recommendation results when no limit is given, and the largest allowed
+    RECOMMENDATIONS_DEFAULT_LIMIT = int(os.environ.get('RECOMMENDATIONS_DEFAULT_LIMIT', 10))
+    RECOMMENDATIONS_MAX_LIMIT = int(os.environ.get('RECOMMENDATIONS_MAX_LIMIT', 100))
+    # Seconds between checks of product_collection for the in-memory catalog snapshot
+    CATALOG_REFRESH_INTERVAL = float(os.environ.get('CATALOG_REFRESH_INTERVAL', 5))
+    # Seconds a recommendation response stays in the Redis cache (0 disables it), how long
+    # a fill lock may be held and how long concurrent misses wait for its result
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+    RESPONSE_CACHE_LOCK_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_LOCK_TIMEOUT', 10))
+    RESPONSE_CACHE_WAIT = float(os.environ.get('RESPONSE_CACHE_WAIT', 2))
+    # Most product ids plus categories accepted by one batch recommendation call
+    BATCH_RECOMMENDATIONS_MAX = int(os.environ.get('BATCH_RECOMMENDATIONS_MAX', 100))
+    
+    # Page size of GET /ai/interactions and /ai/products when no limit is given, and the largest allowed
+    LISTING_DEFAULT_LIMIT = int(os.environ.get('LISTING_DEFAULT_LIMIT', 100))
+    LISTING_MAX_LIMIT = int(os.environ.get('LISTING_MAX_LIMIT', 1000))
+    # Most products accepted by one bulk product upsert
+    BULK_PRODUCTS_MAX = int(os.environ.get('BULK_PRODUCTS_MAX', 10000))
+    # Days raw interaction events are kept (TTL index); training reads the pair counters
+    INTERACTION_RETENTION_DAYS = int(os.environ.get('INTERACTION_RETENTION_DAYS', 90))
+    # Most events accepted by one bulk interaction request
+    BULK_INTERACTIONS_MAX = int(os.environ.get('BULK_INTERACTIONS_MAX', 10000))
+    
+    # Redis Streams ingestion: stream and consumer group, entries read per batch, how long
+    # a read blocks, and after how long an unacknowledged entry is claimed by another consumer
+    INTERACTION_STREAM = os.environ.get('INTERACTION_STREAM', 'ai:interactions')
+    INTERACTION_STREAM_GROUP = os.environ.get('INTERACTION_STREAM_GROUP', 'recommendation')
+    INTERACTION_STREAM_MAXLEN = int(os.environ.get('INTERACTION_STREAM_MAXLEN', 1000000))
+    INTERACTION_STREAM_BATCH = int(os.environ.get('INTERACTION_STREAM_BATCH', 500))
+    INTERACTION_STREAM_BLOCK_MS = int(os.environ.get('INTERACTION_STREAM_BLOCK_MS', 5000))
+    INTERACTION_STREAM_CLAIM_IDLE_MS = int(os.environ.get('INTERACTION_STREAM_CLAIM_IDLE_MS', 60000))
+    
+    # Seconds between beat-scheduled training checks; runs are skipped when the data is unchanged
+    CATEGORY_TRAINING_INTERVAL = int(os.environ.get('CATEGORY_TRAINING_INTERVAL', 300))
+    INTERACTION_TRAINING_INTERVAL = int(os.environ.get('INTERACTION_TRAINING_INTERVAL', 300))
+    # New products / interactions that trigger a training run before the next beat check
+    CATEGORY_TRAINING_THRESHOLD = int(os.environ.get('CATEGORY_TRAINING_THRESHOLD', 100))
+    INTERACTION_TRAINING_THRESHOLD = int(os.environ.get('INTERACTION_TRAINING_THRESHOLD', 1000))
+    # Implicit-feedback ALS embeddings, refit from scratch every ALS_TRAINING_INTERVAL
+    # seconds when the interactions changed
+    ALS_TRAINING_INTERVAL = int(os.environ.get('ALS_TRAINING_INTERVAL', 3600))
+    ALS_FACTORS = int(os.environ.get('ALS_FACTORS', 64))
+    ALS_ITERATIONS = int(os.environ.get('ALS_ITERATIONS', 15))
+    ALS_REGULARIZATION = float(os.environ.get('ALS_REGULARIZATION', 0.1))
+    ALS_ALPHA = float(os.environ.get('ALS_ALPHA', 40))
+    # Processes used for exact neighbor computation (0 = all cores) and the
+    # memory each one may spend on a dense similarity block
+    TRAINING_WORKERS = int(os.environ.get('TRAINING_WORKERS', 0))
+    SIMILARITY_MEMORY_MB = int(os.environ.get('SIMILARITY_MEMORY_MB', 256))
+    # Approximate (random-projection LSH) neighbor search for catalogs of at least
+    # ANN_MIN_PRODUCTS; more tables raise recall, more bits make queries faster
+    ANN_ENABLED = os.environ.get('ANN_ENABLED', '1') == '1'
+    ANN_MIN_PRODUCTS = int(os.environ.get('ANN_MIN_PRODUCTS', 20000))
+    ANN_BITS = int(os.environ.get('ANN_BITS', 8))
+    ANN_TABLES = int(os.environ.get('ANN_TABLES', 16))
+    ANN_MAX_CANDIDATES = int(os.environ.get('ANN_MAX_CANDIDATES', 2000))
+    # Versioned model artifacts, the newest MODEL_RETENTION versions are kept for rollback
+    MODEL_DIR = os.environ.get('MODEL_DIR', 'ai-models')
+    MODEL_RETENTION = int(os.environ.get('MODEL_RETENTION', 5))
+    # Seconds incremental reads re-scan behind the previous watermark, so writes stamped
+    # before it but committed after the read (a slow bulk write) are still picked up;
+    # must exceed the longest write. Re-read interaction counters replace their earlier
+    # value; re-read products are re-placed in the category model but not fitted again
+    WATERMARK_GRACE_SECONDS = int(os.environ.get('WATERMARK_GRACE_SECONDS', 60))
+    # Upper bound on a single training run holding its model's lock
+    TRAINING_LOCK_TIMEOUT = int(os.environ.get('TRAINING_LOCK_TIMEOUT', 1800))
 
 
 app_config = {
@@ -5,7 +5,9 @@ from werkzeug.wrappers import Response
 class TokenMiddleware:
     
     exclude_routes = {'/ai/interaction-recommendations', 
-                      '/ai/category-recommendations'}
+                      '/ai/category-recommendations',
+                      '/ai/user-recommendations',
+                      '/ai/recommendations/batch'}
     
     def __init__(self, app, exclude_routes = None):
         self.app = app
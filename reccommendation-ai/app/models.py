@@ -1,9 +1,69 @@
 from app import mongo
+from app.config import Config
 from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 
 # set interaction collection
 product_interactions = mongo.db['user_product_interactions']
 product_collection = mongo.db['product_collection']
+# (user_id, product_id) -> view count, first/last seen; what training reads
+interaction_counters = mongo.db['user_product_interaction_counts']
+
+DUPLICATE_KEY = 11000
+
+
+def ensure_indexes():
+    """
+    Create the indexes the app relies on, idempotently.
+
+    Returns a list of (index, error) for the ones that could not be built;
+    a unique product_id index fails while duplicate products exist, see
+    `dedupe_products`.
+    """
+    indexes = [
+        # Hydration and upserts by product_id, snapshot polling by updated_at and
+        # late arrivals by the model version and cluster that placed them
+        (product_collection, [('product_id', ASCENDING)], {'unique': True}),
+        (product_collection, [('updated_at', ASCENDING)], {}),
+        (product_collection, [('cluster_version', ASCENDING), ('cluster', ASCENDING), ('updated_at', ASCENDING)], {}),
+        # Raw events looked up by pair
+        (product_interactions, [('user_id', ASCENDING), ('product_id', ASCENDING)], {}),
+        # Keyset listings walk (created_at, _id) behind at most one equality
+        # filter, so no page needs an in-memory sort; see `_listing`
+        (product_collection, [('created_at', ASCENDING), ('_id', ASCENDING)], {}),
+        (product_collection, [('category', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)], {}),
+        (product_interactions, [('created_at', ASCENDING), ('_id', ASCENDING)], {}),
+        (product_interactions, [('user_id', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)], {}),
+        (product_interactions, [('product_id', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)], {}),
+        (product_interactions, [('category', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)], {}),
+        # Counters are upserted by pair and scanned by last_seen watermark
+        (interaction_counters, [('user_id', ASCENDING), ('product_id', ASCENDING)], {'unique': True}),
+        (interaction_counters, [('last_seen', ASCENDING)], {}),
+    ]
+
+    failures = []
+    for collection, keys, options in indexes:
+        try:
+            collection.create_index(keys, **options)
+        except OperationFailure as e:
+            failures.append((f"{collection.name}.{'_'.join(key for key, _ in keys)}", str(e)))
+
+    try:
+        _ensure_ttl_index(product_interactions, 'created_at', Config.INTERACTION_RETENTION_DAYS * 86400)
+    except OperationFailure as e:
+        failures.append((f"{product_interactions.name}.created_at_ttl", str(e)))
+    return failures
+
+
+def _ensure_ttl_index(collection, field, seconds):
+    # Raw events expire after `seconds`; a changed retention is applied in place
+    name = f'{field}_ttl'
+    try:
+        collection.create_index(field, name=name, expireAfterSeconds=seconds)
+    except OperationFailure:
+        mongo.db.command('collMod', collection.name, index={'name': name, 'expireAfterSeconds': seconds})
+
 
 def save_user_interaction(user_id, product_id, category):
     interaction = {
@@ -13,21 +73,335 @@ def save_user_interaction(user_id, product_id, category):
         'created_at': datetime.utcnow()
     }
     product_interactions.insert_one(interaction)
+    _increment_counters([interaction], interaction['created_at'])
+
+
+def _increment_counters(events, seen_at):
+    # One upsert per distinct pair, repeated views of a pair in the batch are summed
+    pairs = {}
+    for event in events:
+        pair = pairs.setdefault((event['user_id'], event['product_id']), {'count': 0})
+        pair['count'] += 1
+        pair['category'] = event['category']
+
+    operations = [
+        UpdateOne(
+            {'user_id': user_id, 'product_id': product_id},
+            {'$inc': {'count': pair['count']},
+             '$min': {'first_seen': seen_at},
+             '$max': {'last_seen': seen_at},
+             '$set': {'category': pair['category']}},
+            upsert=True,
+        )
+        for (user_id, product_id), pair in pairs.items()
+    ]
+
+    try:
+        interaction_counters.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Concurrent upserts of a new pair race on the unique index, the loser
+        # retries as an update of the winner's document
+        retry = [operations[error['index']] for error in e.details.get('writeErrors', [])
+                 if error.get('code') == DUPLICATE_KEY]
+        if len(retry) < len(e.details.get('writeErrors', [])):
+            raise
+        interaction_counters.bulk_write(retry, ordered=False)
+
+
+def validate_interaction(event):
+    # Same rule as the single-event endpoint, None when the event is valid
+    if not isinstance(event, dict):
+        return 'event must be an object'
+    if not event.get('user_id') or not event.get('product_id') or not event.get('category'):
+        return 'user_id, product_id, and category are required'
+    if not all(isinstance(event[field], (str, int)) for field in ('user_id', 'product_id')):
+        return 'user_id and product_id must be strings or integers'
+    return None
+
+
+def save_user_interactions(events, ids=None):
+    """
+    Insert validated events with one unordered insert_many.
+
+    `ids` optionally gives each event a stable _id, such as its stream entry
+    id, which makes a redelivered event a duplicate key: it is skipped
+    rather than stored and counted twice. Should the counter update fail
+    after the insert, the redelivery does not count those events again;
+    `flask interactions rebuild-counters --after --before` adds the events
+    of that window back.
+
+    Returns the number inserted and a list of (position in `events`, message)
+    for the documents MongoDB rejected; the rest are written regardless.
+    """
+    if not events:
+        return 0, []
+
+    created_at = datetime.utcnow()
+    interactions = [{
+        'user_id': event['user_id'],
+        'product_id': event['product_id'],
+        'category': event['category'],
+        'created_at': created_at,
+    } for event in events]
+    if ids is not None:
+        for interaction, _id in zip(interactions, ids):
+            interaction['_id'] = _id
+
+    try:
+        product_interactions.insert_many(interactions, ordered=False)
+        write_errors = []
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+
+    # Events already stored under their id were counted when first written
+    replayed = {error['index'] for error in write_errors if ids is not None and error.get('code') == DUPLICATE_KEY}
+    errors = [(error['index'], error.get('errmsg', 'write failed'))
+              for error in write_errors if error['index'] not in replayed]
+
+    # Only the events stored by this call count towards the pair counters
+    rejected = {error['index'] for error in write_errors}
+    stored = [interaction for index, interaction in enumerate(interactions) if index not in rejected]
+    if stored:
+        _increment_counters(stored, created_at)
+    return len(stored), errors
     
 
-def save_product_collection(product_name, product_id, category):
-    collection = {
-        'product_id': product_id,
-        'product_name': product_name,
-        'category': category,
-        'created_at': datetime.utcnow()
+def save_product_collection(product_name, product_id, category, cluster=None, cluster_version=None):
+    # Idempotent upsert by product_id, re-seeding updates the product in place
+    query, update = _product_upsert(
+        {'product_id': product_id, 'product_name': product_name, 'category': category},
+        (cluster, cluster_version), datetime.utcnow())
+    try:
+        product_collection.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first write of the same product won the insert, update it instead
+        product_collection.update_one(query, update, upsert=True)
+
+
+def validate_product(product):
+    # Same rule as the single-product endpoint, None when the product is valid
+    if not isinstance(product, dict):
+        return 'product must be an object'
+    if not product.get('product_name') or not product.get('product_id') or not product.get('category'):
+        return 'product_name, product_id, and category are required'
+    if not isinstance(product['product_id'], (str, int)):
+        return 'product_id must be a string or an integer'
+    if not isinstance(product['category'], str):
+        return 'category must be a string'
+    return None
+
+
+def save_products(products, clusters):
+    """
+    Upsert validated products by product_id with one unordered bulk_write.
+
+    `clusters` holds each product's (cluster, model version) from
+    `assign_cluster`. Returns the number written and a list of (position in
+    `products`, message) for rejected writes.
+    """
+    if not products:
+        return 0, []
+
+    updated_at = datetime.utcnow()
+    operations = [
+        UpdateOne(*_product_upsert(product, placement, updated_at), upsert=True)
+        for product, placement in zip(products, clusters)
+    ]
+    try:
+        product_collection.bulk_write(operations, ordered=False)
+        return len(products), []
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+
+    # Products first written concurrently by another request are retried as updates
+    retry = [error['index'] for error in write_errors if error.get('code') == DUPLICATE_KEY]
+    errors = [(error['index'], error.get('errmsg', 'write failed'))
+              for error in write_errors if error.get('code') != DUPLICATE_KEY]
+    if retry:
+        try:
+            product_collection.bulk_write([operations[index] for index in retry], ordered=False)
+        except BulkWriteError as e:
+            errors.extend((retry[error['index']], error.get('errmsg', 'write failed'))
+                          for error in e.details.get('writeErrors', []))
+    return len(products) - len(errors), sorted(errors)
+
+
+def _product_upsert(product, placement, now):
+    # created_at is kept from the first write, updated_at moves on every write;
+    # `placement` is the (cluster, model version) the product was assigned
+    cluster, cluster_version = placement
+    return {'product_id': product['product_id']}, {
+        '$set': {
+            'product_name': product['product_name'],
+            'category': product['category'],
+            'cluster': cluster,
+            'cluster_version': cluster_version,
+            'updated_at': now,
+        },
+        '$setOnInsert': {'created_at': now},
     }
-    product_collection.insert_one(collection)
+
+
+def dedupe_products():
+    """
+    Delete duplicate product documents, keeping the most recently written
+    one per product_id. Returns the number of documents removed.
+    """
+    pipeline = [
+        {'$sort': {'updated_at': -1, 'created_at': -1, '_id': -1}},
+        {'$group': {'_id': '$product_id', 'ids': {'$push': '$_id'}, 'copies': {'$sum': 1}}},
+        {'$match': {'copies': {'$gt': 1}}},
+    ]
+    removed = 0
+    for duplicate in product_collection.aggregate(pipeline, allowDiskUse=True):
+        removed += product_collection.delete_many({'_id': {'$in': duplicate['ids'][1:]}}).deleted_count
+    return removed
+
+
+def get_user_interactions(filters=None, after=None, limit=None, batch_size=1000):
+    """
+    Cursor over interactions newest first, see `_listing`. `filters` may hold
+    user_id, product_id and category.
+    """
+    return _listing(product_interactions, filters, after, limit, batch_size)
+
+
+def get_product_collection(filters=None, after=None, limit=None, batch_size=1000):
+    # Cursor over products newest first, `filters` may hold product_id and category;
+    # the cluster placement and write bookkeeping stay internal
+    return _listing(product_collection, filters, after, limit, batch_size,
+                    projection={'cluster': 0, 'cluster_version': 0, 'updated_at': 0})
+
+
+def _listing(collection, filters, after, limit, batch_size, projection=None):
+    """
+    Keyset-paginated read ordered by (created_at, _id) descending.
+
+    `after` is the (created_at, _id) of the last document of the previous
+    page; the next page starts strictly below it. `ensure_indexes` builds a
+    (filter, created_at, _id) index per filter, which the planner walks in
+    order instead of sorting in memory; no index is hinted, so listings
+    still work while an index is missing. Ids come from query strings and
+    match both their string and integer form. With no `limit` the cursor streams every matching document
+    in `batch_size` batches.
+    """
+    query = {}
+    for field, value in (filters or {}).items():
+        query[field] = value if field == 'category' else {'$in': _id_forms(value)}
+
+    if after is not None:
+        created_at, _id = after
+        query['$or'] = [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': _id}},
+        ]
+        if not isinstance(_id, str):
+            # String _ids (stream entry ids) sort below every ObjectId
+            query['$or'].append({'created_at': created_at, '_id': {'$type': 'string'}})
+
+    cursor = collection.find(query, projection, batch_size=batch_size).sort([('created_at', -1), ('_id', -1)])
+    return cursor.limit(limit) if limit else cursor
+
+
+def _id_forms(value):
+    forms = [value]
+    if isinstance(value, str) and value.lstrip('-').isdigit():
+        forms.append(int(value))
+    return forms
+
+
+def latest_interaction_at():
+    latest = interaction_counters.find_one({}, {'_id': 0, 'last_seen': 1}, sort=[('last_seen', -1)])
+    return latest['last_seen'] if latest else None
+
+
+def iter_interaction_counts(created_after=None, created_until=None, batch_size=10000):
+    """
+    Stream the (product_id, user_id, count, category, last_seen) counters of
+    pairs last seen in (created_after, created_until].
+
+    Counts are running totals, so a pair seen again since an earlier read
+    comes back with its full count and replaces the earlier value.
+    """
+    query = {'product_id': {'$ne': None}, 'user_id': {'$ne': None}}
+    last_seen = {}
+    if created_after is not None:
+        last_seen['$gt'] = created_after
+    if created_until is not None:
+        last_seen['$lte'] = created_until
+    if last_seen:
+        query['last_seen'] = last_seen
+
+    return interaction_counters.find(
+        query,
+        {'_id': 0, 'product_id': 1, 'user_id': 1, 'count': 1, 'category': 1, 'last_seen': 1},
+        batch_size=batch_size,
+    )
+
+
+def rebuild_interaction_counters(created_after=None, created_before=None):
+    """
+    Add the raw events created in [created_after, created_before) to the
+    pair counters, used to backfill events stored before the counters
+    existed or whose counter update failed.
+
+    The repair is additive: counts are summed and first/last seen widened,
+    so counters keep the history of events the TTL index already expired.
+    Events in the window that were counted already are counted again, the
+    window must only cover uncounted events.
+    """
+    match = {'product_id': {'$ne': None}, 'user_id': {'$ne': None}}
+    created_at = {}
+    if created_after is not None:
+        created_at['$gte'] = created_after
+    if created_before is not None:
+        created_at['$lt'] = created_before
+    if created_at:
+        match['created_at'] = created_at
+
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'created_at': 1}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'product_id': '$product_id'},
+            'count': {'$sum': 1},
+            'category': {'$last': '$category'},
+            'first_seen': {'$first': '$created_at'},
+            'last_seen': {'$last': '$created_at'},
+        }},
+        {'$project': {'_id': 0, 'user_id': '$_id.user_id', 'product_id': '$_id.product_id',
+                      'count': 1, 'category': 1, 'first_seen': 1, 'last_seen': 1}},
+        {'$merge': {'into': interaction_counters.name, 'on': ['user_id', 'product_id'],
+                    'whenMatched': [{'$set': {
+                        'count': {'$add': ['$count', '$$new.count']},
+                        'first_seen': {'$min': ['$first_seen', '$$new.first_seen']},
+                        'last_seen': {'$max': ['$last_seen', '$$new.last_seen']},
+                        'category': {'$cond': [{'$gte': ['$$new.last_seen', '$last_seen']},
+                                               '$$new.category', '$category']},
+                    }}],
+                    'whenNotMatched': 'insert'}},
+    ]
+    product_interactions.aggregate(pipeline, allowDiskUse=True)
+
+
+def iter_product_categories(updated_after=None, batch_size=10000):
+    # Products written (inserted or re-categorised) after `updated_after`
+    query = {'product_id': {'$ne': None}, 'category': {'$ne': None}}
+    if updated_after is not None:
+        query['updated_at'] = {'$gt': updated_after}
     
+    return product_collection.find(
+        query,
+        {'_id': 0, 'product_id': 1, 'category': 1, 'updated_at': 1, 'created_at': 1},
+        batch_size=batch_size,
+    )
 
-def get_user_interactions():
-    return list(product_interactions.find({}, {'_id':0}).sort('created_at', -1))
 
-def get_product_collection():
-    return list(product_collection.find({}, {'_id':0}).sort('created_at', -1))
-    
\ No newline at end of file
+def iter_product_views(batch_size=10000):
+    # Total views per product, the popularity used to rank category recommendations
+    pipeline = [
+        {'$match': {'product_id': {'$ne': None}}},
+        {'$group': {'_id': '$product_id', 'views': {'$sum': '$count'}}},
+        {'$project': {'_id': 0, 'product_id': '$_id', 'views': 1}},
+    ]
+    return interaction_counters.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
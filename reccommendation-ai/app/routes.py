@@ -1,10 +1,23 @@
-from flask import Blueprint, request, jsonify, Response
-from app.services import plain_cat_model, user_interaction_model
+import base64
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Blueprint, current_app, request, jsonify, Response, stream_with_context
+from app.config import Config
+from app.services import plain_cat_model, user_interaction_model, als_model
+from app.services.cache import cached_response
+from app.services.catalog import catalog, CATALOG_FIELDS
+from app.services.training import record_changes
 from datetime import datetime
-from bson.json_util import dumps
 from app.models import (save_user_interaction, get_user_interactions, 
-                        save_product_collection, get_product_collection, 
-                        product_collection)
+                        save_product_collection, get_product_collection,
+                        save_user_interactions, validate_interaction,
+                        save_products, validate_product)
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
 
 
 recommendation_bp = Blueprint('recommendation', __name__)
@@ -13,99 +26,399 @@ recommendation_bp = Blueprint('recommendation', __name__)
 def get_interaction_recommendations():
     product_id = request.args.get('product_id')
     category = request.args.get('category') 
-    offset = request.args.get('offset')
+    page = _page_args(request.args)
+    fields = _fields_arg(request.args.get('fields'))
 
     if not product_id or not category:
         return jsonify({'error': 'Missing product_id or category'}), 400
 
-    recommended_product_ids = user_interaction_model.recommend_products(product_id, category)
-    
-    # Query MongoDB using recommended product IDs
-    recommended_products = product_collection.find({
-        "product_id": {"$in": recommended_product_ids}
-    })
-
-    recommended_products_list = list(recommended_products)
+    if page is None:
+        return _invalid_page()
 
-    # Serialize the result to JSON
-    response = dumps(recommended_products_list)
+    if fields is False:
+        return _invalid_fields()
 
-    return Response(response, mimetype='application/json')
+    # Neighbors ranked by similarity, only the requested page is hydrated
+    limit, offset = page
+    return _cached_json_response(
+        'interaction-recommendations',
+        {'product_id': product_id, 'category': category, 'limit': limit, 'offset': offset, 'fields': fields},
+        [user_interaction_model.model_name],
+        lambda: catalog.get(user_interaction_model.recommend_products(product_id, category, limit, offset), fields),
+    )
 
 
 @recommendation_bp.route('/category-recommendations', methods=['GET'])
 def get_category_recommendations():
     category = request.args.get('category') 
-    offset = request.args.get('offset')
+    page = _page_args(request.args)
+    fields = _fields_arg(request.args.get('fields'))
 
     if not category:
         return jsonify({'error': 'Missing category'}), 400
 
-    # Get recommended product IDs from the model
-    recommended_product_ids = plain_cat_model.recommend_products(category)
+    if page is None:
+        return _invalid_page()
+
+    if fields is False:
+        return _invalid_fields()
+
+    # Cluster members ranked by popularity, only the requested page is hydrated
+    limit, offset = page
+    return _cached_json_response(
+        'category-recommendations',
+        {'category': category, 'limit': limit, 'offset': offset, 'fields': fields},
+        [plain_cat_model.model_name],
+        lambda: catalog.get(plain_cat_model.recommend_products(category, limit, offset), fields),
+    )
+
+
+@recommendation_bp.route('/user-recommendations', methods=['GET'])
+def get_user_recommendations():
+    user_id = request.args.get('user_id')
+    page = _page_args(request.args)
+    fields = _fields_arg(request.args.get('fields'))
+
+    if not user_id:
+        return jsonify({'error': 'Missing user_id'}), 400
+
+    if page is None:
+        return _invalid_page()
+
+    if fields is False:
+        return _invalid_fields()
+
+    # Products with the highest predicted preference from the user's embedding
+    limit, offset = page
+    return _cached_json_response(
+        'user-recommendations',
+        {'user_id': user_id, 'limit': limit, 'offset': offset, 'fields': fields},
+        [als_model.model_name],
+        lambda: catalog.get(als_model.recommend_for_user(user_id, limit, offset), fields),
+    )
+
+
+@recommendation_bp.route('/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
 
-    # Query MongoDB using recommended product IDs
-    recommended_products = product_collection.find({
-        "product_id": {"$in": recommended_product_ids}
+    product_ids = data.get('product_ids') or []
+    categories = data.get('categories') or []
+    category = data.get('category')
+    page = _page_args(data)
+    fields = _fields_arg(data.get('fields'))
+
+    if not isinstance(product_ids, list) or not isinstance(categories, list):
+        return jsonify({'error': 'product_ids and categories must be lists'}), 400
+
+    if not product_ids and not categories:
+        return jsonify({'error': 'Missing product_ids or categories'}), 400
+
+    if not all(isinstance(name, str) for name in categories):
+        return jsonify({'error': 'categories must be strings'}), 400
+
+    if len(product_ids) + len(categories) > Config.BATCH_RECOMMENDATIONS_MAX:
+        return jsonify({'error': f'At most {Config.BATCH_RECOMMENDATIONS_MAX} product_ids and categories per batch'}), 400
+
+    if page is None:
+        return _invalid_page()
+
+    if fields is False:
+        return _invalid_fields()
+
+    # One vectorized lookup per model, `category` filters every interaction result
+    limit, offset = page
+    interaction_ids = user_interaction_model.recommend_many(product_ids, category, limit, offset) if product_ids else []
+    category_ids = plain_cat_model.recommend_many(categories, limit, offset) if categories else []
+
+    # Results are keyed by the inputs as sent, hydrated from the in-memory catalog in ranking order
+    return _json_response({
+        'interaction': {str(product_id): catalog.get(ids, fields) for product_id, ids in zip(product_ids, interaction_ids)},
+        'category': {str(name): catalog.get(ids, fields) for name, ids in zip(categories, category_ids)},
     })
 
-    recommended_products_list = list(recommended_products)
 
-    # Serialize the result to JSON
-    response = dumps(recommended_products_list)
+def _page_args(args):
+    # (limit, offset) from query-string or JSON values, None when invalid
+    try:
+        limit = int(args.get('limit', Config.RECOMMENDATIONS_DEFAULT_LIMIT))
+        offset = int(args.get('offset') or 0)
+    except (TypeError, ValueError):
+        return None
+
+    if not 1 <= limit <= Config.RECOMMENDATIONS_MAX_LIMIT or offset < 0:
+        return None
+    return limit, offset
+
+
+def _invalid_page():
+    return jsonify({'error': f'limit must be between 1 and {Config.RECOMMENDATIONS_MAX_LIMIT} '
+                             f'and offset a non-negative integer'}), 400
+
 
-    return Response(response, mimetype='application/json')
+def _fields_arg(value):
+    # Projection from a comma-separated string or a JSON list, None for every
+    # field and False when it names an unknown field
+    if not value:
+        return None
+    if not isinstance(value, (str, list)):
+        return False
+    fields = value.split(',') if isinstance(value, str) else value
+    fields = [str(field).strip() for field in fields if str(field).strip()]
+    if not fields or any(field not in CATALOG_FIELDS for field in fields):
+        return False
+    return fields
+
+
+def _invalid_fields():
+    return jsonify({'error': f'fields must be a comma-separated subset of {", ".join(CATALOG_FIELDS)}'}), 400
+
+
+@recommendation_bp.errorhandler(FileNotFoundError)
+def _model_not_trained(error):
+    # A model with no trained version yet, the recommendation endpoints answer in JSON
+    return jsonify({'error': str(error)}), 503
+
+
+def _encode_json(data):
+    return orjson.dumps(data) if orjson is not None else json.dumps(data, separators=(',', ':')).encode()
+
+
+def _json_response(data):
+    return Response(_encode_json(data), mimetype='application/json')
+
+
+def _cached_json_response(endpoint, params, model_names, compute):
+    # Hydrated results from the response cache, 304 when If-None-Match has the ETag
+    body, etag = cached_response(endpoint, params, model_names, lambda: _encode_json(compute()))
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @recommendation_bp.route('/interactions', methods=['POST'])
 def save_interaction():
     data = request.json
+    error = validate_interaction(data)
+    if error:
+        return jsonify({'error': error}), 400
+
     user_id = data.get('user_id')
     product_id = data.get('product_id')
     category = data.get('category')
 
-    if not user_id or not product_id or not category:
-        return jsonify({'error': 'user_id, product_id, and category are required'}), 400
-
     save_user_interaction(user_id, product_id, category)
+    record_changes('interaction')
     
     return jsonify({'message': 'Interaction saved successfully'}), 201
 
 
-@recommendation_bp.route('/interactions', methods=['GET'])
-def get_interactions():
+@recommendation_bp.route('/interactions/bulk', methods=['POST'])
+def save_interactions_bulk():
+    # A JSON array of events, or one JSON event per line (NDJSON)
+    events, errors = _parse_events(request.get_data())
+    if not events:
+        return jsonify({'error': 'Body must be a non-empty JSON array or NDJSON events'}), 400
+
+    if len(events) > Config.BULK_INTERACTIONS_MAX:
+        return jsonify({'error': f'At most {Config.BULK_INTERACTIONS_MAX} events per request'}), 400
+
+    # Validate everything in one pass, then write the valid events in one insert_many
+    valid, positions = [], []
+    for index, event in enumerate(events):
+        if index in errors:
+            continue
+        error = validate_interaction(event)
+        if error:
+            errors[index] = error
+        else:
+            valid.append(event)
+            positions.append(index)
+
+    inserted, write_errors = save_user_interactions(valid)
+    for position, error in write_errors:
+        errors[positions[position]] = error
+
+    if inserted:
+        record_changes('interaction', inserted)
+
+    status = 201 if not errors else 207 if inserted else 400
+    return jsonify({
+        'inserted': inserted,
+        'errors': [{'index': index, 'error': error} for index, error in sorted(errors.items())],
+    }), status
+
+
+def _parse_events(body):
+    # (items, {index: parse error}) from a JSON array or NDJSON body, items is
+    # None when the body is neither format
+    text = body.decode('utf-8', errors='replace').strip()
+    if text.startswith('['):
+        try:
+            events = json.loads(text)
+        except ValueError:
+            return None, {}
+        return (events, {}) if isinstance(events, list) else (None, {})
+
+    events, errors = [], {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            errors[len(events)] = 'invalid JSON'
+            events.append(None)
+    return events, errors
 
-    # Assuming get_interactions is a function that retrieves interactions from a database
-    interactions = get_user_interactions()
 
-    if not interactions:
-        return jsonify({'message': 'No interactions found'}), 404
-    
-    return jsonify({'interactions': interactions}), 200
+@recommendation_bp.route('/interactions', methods=['GET'])
+def get_interactions():
+    # Newest first, one page per request or every match with ?format=ndjson
+    return _listing_response('interactions', get_user_interactions, ('user_id', 'product_id', 'category'))
+
+
+def _listing_response(name, find, filter_fields):
+    """
+    Keyset-paginated listing of `find` results as `{name: [...], 'next_cursor': ...}`.
+
+    Pass `next_cursor` back as `cursor` to read the following page. With
+    `format=ndjson` every matching document after `cursor` is streamed one
+    per line as the MongoDB cursor yields it, ignoring `limit`.
+    """
+    filters = {field: request.args[field] for field in filter_fields if request.args.get(field)}
+    after = _decode_cursor(request.args.get('cursor'))
+    if after is False:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_with_context(_ndjson_chunks(find(filters, after))), mimetype='application/x-ndjson')
+
+    limit = _listing_limit_arg(request.args.get('limit'))
+    if limit is None:
+        return jsonify({'error': f'limit must be between 1 and {Config.LISTING_MAX_LIMIT}'}), 400
+
+    # One extra document tells whether another page follows
+    documents = list(find(filters, after, limit + 1))
+    if not documents and after is None:
+        return jsonify({'message': f'No {name} found'}), 404
+
+    next_cursor = _encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+    documents = documents[:limit]
+    for document in documents:
+        document.pop('_id', None)
+    return jsonify({name: documents, 'next_cursor': next_cursor}), 200
+
+
+def _listing_limit_arg(value):
+    # Page size from the query string, None when invalid
+    try:
+        limit = int(value or Config.LISTING_DEFAULT_LIMIT)
+    except ValueError:
+        return None
+    return limit if 1 <= limit <= Config.LISTING_MAX_LIMIT else None
+
+
+def _encode_cursor(document):
+    # Opaque, URL-safe position of the last document of a page; _id is an
+    # ObjectId, or the stream entry id string for events ingested from Redis
+    _id = document['_id']
+    kind = 'o' if isinstance(_id, ObjectId) else 's'
+    position = f"{document['created_at'].isoformat()}|{kind}{_id}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(value):
+    # (created_at, _id) from a `next_cursor`, None when absent and False when malformed
+    if not value:
+        return None
+    try:
+        position = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, _, _id = position.partition('|')
+        if _id[:1] not in ('o', 's'):
+            return False
+        return datetime.fromisoformat(created_at), ObjectId(_id[1:]) if _id[:1] == 'o' else _id[1:]
+    except (ValueError, InvalidId):
+        return False
+
+
+def _ndjson_chunks(cursor, chunk_size=500):
+    # Lines are flushed every `chunk_size` documents, so an export holds one
+    # chunk and one cursor batch in memory; documents are encoded like the pages
+    chunk = []
+    for document in cursor:
+        document.pop('_id', None)
+        chunk.append(current_app.json.dumps(document) + '\n')
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
 
 
 @recommendation_bp.route('/products', methods=['POST'])
 def seed_products():
     data = request.json
+    error = validate_product(data)
+    if error:
+        return jsonify({'error': error}), 400
+
     product_name = data.get('product_name')
     product_id = data.get('product_id')
     category = data.get('category')
 
-    if not product_name or not product_id or not category:
-        return jsonify({'error': 'product_name, product_id, and category are required'}), 400
-
-    save_product_collection(product_name, product_id, category)
+    # Place the product on its nearest centroid so it is recommendable before retraining
+    cluster, cluster_version = plain_cat_model.assign_cluster(category)
+    save_product_collection(product_name, product_id, category, cluster, cluster_version)
+    record_changes('category')
     
     return jsonify({'message': 'Product saved successfully'}), 201
 
 
-@recommendation_bp.route('/products', methods=['GET'])
-def get_all_products():
+@recommendation_bp.route('/products/bulk', methods=['POST'])
+def save_products_bulk():
+    # A JSON array of products, or one JSON product per line (NDJSON)
+    products, errors = _parse_events(request.get_data())
+    if not products:
+        return jsonify({'error': 'Body must be a non-empty JSON array or NDJSON products'}), 400
+
+    if len(products) > Config.BULK_PRODUCTS_MAX:
+        return jsonify({'error': f'At most {Config.BULK_PRODUCTS_MAX} products per request'}), 400
+
+    valid, positions = [], []
+    for index, product in enumerate(products):
+        if index in errors:
+            continue
+        error = validate_product(product)
+        if error:
+            errors[index] = error
+        else:
+            valid.append(product)
+            positions.append(index)
+
+    # Each distinct category is placed on its nearest centroid once
+    clusters = {}
+    for product in valid:
+        if product['category'] not in clusters:
+            clusters[product['category']] = plain_cat_model.assign_cluster(product['category'])
+
+    written, write_errors = save_products(valid, [clusters[product['category']] for product in valid])
+    for position, error in write_errors:
+        errors[positions[position]] = error
+
+    if written:
+        record_changes('category', written)
+
+    status = 201 if not errors else 207 if written else 400
+    return jsonify({
+        'written': written,
+        'errors': [{'index': index, 'error': error} for index, error in sorted(errors.items())],
+    }), status
 
-    # Assuming get_interactions is a function that retrieves interactions from a database
-    products = get_product_collection()
 
-    if not products:
-        return jsonify({'message': 'No products found'}), 404
-    
-    return jsonify({'products': products}), 200
+@recommendation_bp.route('/products', methods=['GET'])
+def get_all_products():
+    # Newest first, one page per request or every match with ?format=ndjson
+    return _listing_response('products', get_product_collection, ('product_id', 'category'))
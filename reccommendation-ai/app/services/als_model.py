@@ -0,0 +1,138 @@
+import numpy as np, time
+from app.config import Config
+from app.models import iter_interaction_counts, latest_interaction_at
+from app.services.user_interaction_model import _encode_interactions, _interaction_matrix
+from app.services.artifacts import save_artifact, id_array, sort_order, find_rows
+from app.services.registry import registry
+
+model_name = 'implicit_als'
+
+def train_model(model_name=model_name, factors=None, iterations=None, regularization=None,
+                alpha=None, full=False, fingerprint=None):
+    """
+    Factorize the product x user view counts with implicit-feedback ALS.
+
+    Views are preferences with confidence 1 + alpha * count, unviewed pairs
+    are preference 0 with confidence 1 (Hu, Koren & Volinsky). Every run is a
+    full fit, `full` is accepted for the shared training task interface.
+    """
+    factors = factors or Config.ALS_FACTORS
+    iterations = iterations or Config.ALS_ITERATIONS
+    regularization = Config.ALS_REGULARIZATION if regularization is None else regularization
+    alpha = Config.ALS_ALPHA if alpha is None else alpha
+    started = time.monotonic()
+
+    watermark = latest_interaction_at()
+    if watermark is None:
+        print("No interaction data found.")
+        return
+
+    rows = iter_interaction_counts(created_until=watermark)
+    product_ids, user_ids, _, product_codes, user_codes, counts = _encode_interactions(rows, [], [])
+    if not counts:
+        print("No interaction data found.")
+        return
+
+    item_users = _interaction_matrix(product_codes, user_codes, len(product_ids), len(user_ids), counts)
+    user_items = item_users.T.tocsr()
+
+    rng = np.random.default_rng(42)
+    item_factors = (rng.standard_normal((len(product_ids), factors)) * 0.01).astype(np.float32)
+    user_factors = np.zeros((len(user_ids), factors), dtype=np.float32)
+
+    for _ in range(iterations):
+        user_factors = _least_squares(user_items, item_factors, regularization, alpha)
+        item_factors = _least_squares(item_users, user_factors, regularization, alpha)
+
+    product_ids = id_array(product_ids)
+    user_ids = id_array(user_ids)
+    item_norms = np.linalg.norm(item_factors, axis=1)
+    item_norms[item_norms == 0] = 1
+
+    # Factors are all serving needs; the viewed pattern (no counts) lets user
+    # recommendations skip products the user has already seen
+    arrays = {
+        'product_ids': product_ids,
+        'user_ids': user_ids,
+        'item_factors': item_factors,
+        'user_factors': user_factors,
+        'item_norms': item_norms.astype(np.float32),
+        'viewed_indptr': user_items.indptr.astype(np.int64),
+        'viewed_indices': user_items.indices.astype(np.int32),
+    }
+    for key, ids in (('product_order', product_ids), ('user_order', user_ids)):
+        order = sort_order(ids)
+        if order is not None:
+            arrays[key] = order
+
+    save_artifact(model_name, arrays, manifest={
+        'mode': 'full',
+        'fingerprint': fingerprint,
+        'products': len(product_ids),
+        'users': len(user_ids),
+        'interactions': int(item_users.nnz),
+        'factors': factors,
+        'iterations': iterations,
+        'regularization': regularization,
+        'alpha': alpha,
+        'trained_at': watermark.isoformat(),
+        'training_seconds': round(time.monotonic() - started, 3),
+    })
+
+
+def _least_squares(matrix, fixed, regularization, alpha):
+    # Solve every row of `matrix` against the fixed factors of its columns:
+    # (F'F + F'(C - I)F + lambda * I) x = F'C p, only observed columns enter C - I
+    n_factors = fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(n_factors, dtype=np.float32)
+    solved = np.zeros((matrix.shape[0], n_factors), dtype=np.float32)
+
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        observed = fixed[matrix.indices[start:end]]
+        confidence = alpha * matrix.data[start:end]
+        solved[row] = np.linalg.solve(gram + (observed.T * confidence) @ observed,
+                                      observed.T @ (1 + confidence))
+
+    return solved
+
+
+def _top_products(model, scores, n_recommendations, offset=0):
+    n = min(offset + n_recommendations, len(scores))
+    if n <= 0:
+        return []
+
+    top = np.argpartition(-scores, n - 1)[:n]
+    top = top[np.argsort(-scores[top], kind='stable')][offset:]
+    top = top[np.isfinite(scores[top])]
+    return model['product_ids'][top].tolist()
+
+
+def recommend_products(product_id, category=None, n_recommendations=5, offset=0):
+    # Products whose embeddings are closest (cosine) to the given product's
+    model = registry.get(model_name)
+    row = find_rows(model['product_ids'], [product_id], model.arrays.get('product_order'))[0]
+    if row < 0:
+        return []
+
+    item_factors, norms = model['item_factors'], model['item_norms']
+    scores = (item_factors @ item_factors[row]) / (norms * norms[row])
+    scores[row] = -np.inf
+
+    return _top_products(model, scores, n_recommendations, offset)
+
+
+def recommend_for_user(user_id, n_recommendations=5, offset=0):
+    # Highest predicted preference among the products the user has not viewed yet
+    model = registry.get(model_name)
+    row = find_rows(model['user_ids'], [user_id], model.arrays.get('user_order'))[0]
+    if row < 0:
+        return []
+
+    scores = model['item_factors'] @ model['user_factors'][row]
+    viewed = model['viewed_indices'][model['viewed_indptr'][row]:model['viewed_indptr'][row + 1]]
+    scores[viewed] = -np.inf
+
+    return _top_products(model, scores, n_recommendations, offset)
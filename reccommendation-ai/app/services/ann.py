@@ -0,0 +1,111 @@
+import numpy as np
+
+
+class RandomProjectionLSH:
+    """
+    Approximate cosine nearest-neighbor index over l2-normalised row vectors.
+
+    Every table hashes a vector to the sign pattern of its projection on
+    `n_bits` random hyperplanes, so vectors with a small angle between them
+    tend to share a bucket. Candidates are the rows sharing a bucket with the
+    query in any table, ranked by how many tables they collide in and capped
+    at `max_candidates`, then re-scored with exact cosine similarity.
+
+    Recall/latency knobs: more `n_tables` raises recall, more `n_bits` makes
+    buckets smaller and queries faster, `max_candidates` bounds the exact
+    re-scoring work per query.
+
+    Hyperplanes have +/-1 entries derived from a seeded hash of the column
+    index, and only the columns present in a block of rows are ever
+    generated, so memory follows the rows being hashed rather than the
+    number of columns (users).
+    """
+
+    def __init__(self, n_bits=8, n_tables=16, max_candidates=2000, seed=42, block_rows=4096):
+        if not 0 < n_bits <= 64:
+            raise ValueError("n_bits must be between 1 and 64")
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.max_candidates = max_candidates
+        self.seed = seed
+        self.block_rows = block_rows
+
+    def fit(self, vectors):
+        self._vectors = vectors.tocsr()
+
+        # Codes and bucket order are kept table-major so each table is contiguous
+        self._codes = self._hash(self._vectors)
+        self._order = np.argsort(self._codes, axis=1, kind='stable')
+        self._sorted = np.take_along_axis(self._codes, self._order, axis=1)
+        return self
+
+    def query(self, rows, top_k):
+        """Top-k neighbors of indexed `rows`, self excluded, padded with -1 like the exact search."""
+        neighbors = np.full((len(rows), top_k), -1, dtype=np.int32)
+        scores = np.zeros((len(rows), top_k), dtype=np.float32)
+
+        for i, row in enumerate(rows):
+            candidates = self._candidates(row)
+            if not len(candidates):
+                continue
+
+            similarities = (self._vectors[candidates] @ self._vectors[row].T).toarray().ravel()
+            order = np.argsort(-similarities, kind='stable')[:top_k]
+            order = order[similarities[order] > 0]
+            neighbors[i, :len(order)] = candidates[order]
+            scores[i, :len(order)] = similarities[order]
+
+        return neighbors, scores
+
+    def _candidates(self, row):
+        buckets = []
+        for table in range(self.n_tables):
+            code = self._codes[table, row]
+            start = np.searchsorted(self._sorted[table], code, side='left')
+            end = np.searchsorted(self._sorted[table], code, side='right')
+            buckets.append(self._order[table, start:end])
+
+        candidates, collisions = np.unique(np.concatenate(buckets), return_counts=True)
+        keep = candidates != row
+        candidates, collisions = candidates[keep], collisions[keep]
+
+        if len(candidates) > self.max_candidates:
+            strongest = np.argsort(-collisions, kind='stable')[:self.max_candidates]
+            candidates = candidates[strongest]
+        return candidates
+
+    def _hash(self, vectors):
+        # SciPy is only needed by the training worker, never on the serving path
+        from scipy.sparse import csr_matrix
+
+        weights = np.left_shift(np.uint64(1), np.arange(self.n_bits, dtype=np.uint64))
+        codes = np.empty((self.n_tables, vectors.shape[0]), dtype=np.uint64)
+
+        for start in range(0, vectors.shape[0], self.block_rows):
+            block = vectors[start:start + self.block_rows]
+            # Project on the hyperplane entries of the block's own columns only
+            columns, local = np.unique(block.indices, return_inverse=True)
+            compact = csr_matrix((block.data, local.ravel(), block.indptr), shape=(block.shape[0], len(columns)))
+            bits = np.asarray(compact @ self._planes(columns)) > 0
+            bits = bits.reshape(block.shape[0], self.n_tables, self.n_bits)
+            codes[:, start:start + block.shape[0]] = (bits * weights).sum(axis=2, dtype=np.uint64).T
+
+        return codes
+
+    def _planes(self, columns):
+        # (len(columns), n_tables * n_bits) +/-1 hyperplane entries, a pure
+        # function of (seed, column, plane) so every run agrees on them
+        n_planes = self.n_tables * self.n_bits
+        keys = columns.astype(np.uint64)[:, None] * np.uint64(n_planes) + np.arange(n_planes, dtype=np.uint64)
+        bits = _mix64(keys ^ _mix64(np.uint64(self.seed))) >> np.uint64(63)
+        return np.where(bits == 1, 1.0, -1.0).astype(np.float32)
+
+
+def _mix64(values):
+    # splitmix64 finalizer, spreads consecutive keys over all 64 bits; the
+    # arithmetic is modulo 2**64 by design
+    with np.errstate(over='ignore'):
+        values = np.asarray(values, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
@@ -0,0 +1,232 @@
+"""
+Versioned, memory-mappable model artifacts.
+
+Each training run is written to `<MODEL_DIR>/<name>/<version>/` under a
+temporary name and renamed into place once complete, then the `current`
+pointer file is swapped with os.replace. Readers resolve `current` and load
+an immutable version directory, so they never see a partially written model
+and need no locks. The last MODEL_RETENTION versions are kept for rollback.
+
+A version directory holds one `.npy` file per array, a small JSON manifest
+and, optionally, pickled training-only objects. Serving workers open the
+arrays read-only with mmap, so every worker on a host shares one page-cache
+copy and a reload only parses the manifest.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from app.config import Config
+
+MANIFEST_FILE = 'manifest.json'
+OBJECTS_FILE = 'objects.pkl'
+CURRENT_POINTER = 'current'
+
+
+class Artifact:
+    """A loaded model version: mmapped arrays, the manifest and lazy pickled objects."""
+
+    def __init__(self, path, version, manifest, arrays):
+        self.path = path
+        self.version = version
+        self.manifest = manifest
+        self.arrays = arrays
+        self._objects = None
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def objects(self):
+        if self._objects is None:
+            import joblib
+            self._objects = joblib.load(os.path.join(self.path, OBJECTS_FILE))
+        return self._objects
+
+
+def save_artifact(name, arrays=None, objects=None, manifest=None, model_dir=None, retention=None):
+    root = _model_root(name, model_dir)
+    os.makedirs(root, exist_ok=True)
+    arrays = {key: np.asarray(array) for key, array in (arrays or {}).items()}
+
+    version = datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')
+    staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=root)
+    try:
+        for key, array in arrays.items():
+            np.save(os.path.join(staging, f'{key}.npy'), array, allow_pickle=array.dtype == object)
+        if objects is not None:
+            import joblib
+            joblib.dump(objects, os.path.join(staging, OBJECTS_FILE))
+        _write_json(os.path.join(staging, MANIFEST_FILE), {
+            'version': version,
+            'created_at': datetime.utcnow().isoformat(),
+            'arrays': sorted(arrays),
+            # Object arrays (mixed id types) are pickled and cannot be mmapped
+            'pickled_arrays': sorted(key for key, array in arrays.items() if array.dtype == object),
+            **(manifest or {}),
+        })
+        os.rename(staging, os.path.join(root, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    set_current(name, version, model_dir)
+    prune(name, retention, model_dir)
+    return version
+
+
+def load_artifact(name, version=None, model_dir=None, mmap=True):
+    version = version or _require_current(name, model_dir)
+    path = os.path.join(_model_root(name, model_dir), version)
+    manifest = load_manifest(name, version, model_dir)
+
+    # Opening a mapping reads no data, pages are faulted in on first access
+    pickled = set(manifest.get('pickled_arrays', []))
+    arrays = {
+        key: np.load(
+            os.path.join(path, f'{key}.npy'),
+            mmap_mode='r' if mmap and key not in pickled else None,
+            allow_pickle=key in pickled,
+        )
+        for key in manifest['arrays']
+    }
+    return Artifact(path, version, manifest, arrays)
+
+
+def load_manifest(name, version=None, model_dir=None):
+    version = version or current_version(name, model_dir)
+    if version is None:
+        return None
+    with open(os.path.join(_model_root(name, model_dir), version, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def id_array(ids):
+    # Keep native int/str dtypes so ids round-trip unchanged into Mongo queries
+    kinds = {type(value) for value in ids}
+    if kinds <= {int}:
+        return np.array(ids, dtype=np.int64)
+    if kinds <= {str}:
+        return np.array(ids, dtype=str)
+    return np.array(ids, dtype=object)
+
+
+def sort_order(ids):
+    """Sorter for `find_rows`, None for mixed-type ids which cannot be ordered."""
+    if ids.dtype == object:
+        return None
+    return np.argsort(ids, kind='stable').astype(np.int32)
+
+
+def find_rows(ids, keys, order=None):
+    """
+    Positions of `keys` in `ids` (-1 when missing) by binary search.
+
+    `order` is the sorter from `sort_order`, omit it when `ids` is already
+    sorted. Keys may come from query strings, so they are coerced to the
+    dtype of `ids`.
+    """
+    keys = list(keys)
+    rows = np.full(len(keys), -1, dtype=np.int64)
+    if not len(ids):
+        return rows
+
+    if ids.dtype == object:
+        lookup = {str(value): row for row, value in enumerate(ids.tolist())}
+        for i, key in enumerate(keys):
+            rows[i] = lookup.get(str(key), -1)
+        return rows
+
+    coerced, valid = _coerce_keys(keys, ids.dtype)
+    positions = np.minimum(np.searchsorted(ids, coerced, sorter=order), len(ids) - 1)
+    if order is not None:
+        positions = order[positions]
+    found = valid & (ids[positions] == coerced)
+    rows[found] = positions[found]
+    return rows
+
+
+def _coerce_keys(keys, dtype):
+    valid = np.ones(len(keys), dtype=bool)
+    if dtype.kind in 'iu':
+        coerced = np.zeros(len(keys), dtype=dtype)
+        for i, key in enumerate(keys):
+            try:
+                coerced[i] = int(key)
+            except (TypeError, ValueError):
+                valid[i] = False
+        return coerced, valid
+    return np.array([str(key) for key in keys], dtype=str), valid
+
+
+def current_version(name, model_dir=None):
+    try:
+        with open(os.path.join(_model_root(name, model_dir), CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(name, version, model_dir=None):
+    root = _model_root(name, model_dir)
+    if not os.path.isdir(os.path.join(root, version)):
+        raise ValueError(f"Model {name} has no version {version}.")
+
+    fd, staging = tempfile.mkstemp(prefix='.current-', dir=root)
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    os.replace(staging, os.path.join(root, CURRENT_POINTER))
+
+
+def list_versions(name, model_dir=None):
+    root = _model_root(name, model_dir)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        entry for entry in os.listdir(root)
+        if not entry.startswith('.') and os.path.isdir(os.path.join(root, entry))
+    )
+
+
+def rollback(name, version=None, model_dir=None):
+    """Point `current` at `version`, or at the version before the current one."""
+    if version is None:
+        versions = list_versions(name, model_dir)
+        current = current_version(name, model_dir)
+        older = [v for v in versions if current is None or v < current]
+        if not older:
+            raise ValueError(f"Model {name} has no older version to roll back to.")
+        version = older[-1]
+
+    set_current(name, version, model_dir)
+    return version
+
+
+def prune(name, retention=None, model_dir=None):
+    retention = retention or Config.MODEL_RETENTION
+    current = current_version(name, model_dir)
+    versions = list_versions(name, model_dir)
+
+    for version in versions[:-retention]:
+        if version != current:
+            shutil.rmtree(os.path.join(_model_root(name, model_dir), version), ignore_errors=True)
+
+
+def _require_current(name, model_dir):
+    version = current_version(name, model_dir)
+    if version is None:
+        raise FileNotFoundError(f"The model {name} has no trained version. Train the model first.")
+    return version
+
+
+def _model_root(name, model_dir):
+    return os.path.join(model_dir or Config.MODEL_DIR, name)
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, default=str)
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import time
+
+from redis.exceptions import RedisError
+
+from app import redis_client
+from app.config import Config
+from app.services.registry import registry
+
+CACHE_KEY = 'ai:cache:{}'
+FILL_LOCK_KEY = 'ai:cache:{}:lock'
+
+
+def cached_response(endpoint, params, model_names, compute):
+    """
+    Return `(body, etag)` for a response, from Redis when possible.
+
+    The key covers the endpoint, the request parameters and the version each
+    of `model_names` currently serves, so a model swap moves every request to
+    new keys and old entries simply expire. `compute()` must return the
+    encoded body. Concurrent misses for one key compute it once: the first
+    caller takes a fill lock, the others wait for its result. When Redis is
+    unavailable responses are computed uncached.
+    """
+    if Config.RESPONSE_CACHE_TTL <= 0:
+        return _entry(compute())
+
+    versions = [registry.get(name).version for name in model_names]
+    digest = _digest([endpoint, params, versions])
+
+    try:
+        cached = redis_client.get(CACHE_KEY.format(digest))
+        if cached is None:
+            cached = _fill(digest, compute)
+    except RedisError as e:
+        print(f"Response cache unavailable: {e}")
+        return _entry(compute())
+
+    etag, _, body = cached.partition(b'\n')
+    return body, etag.decode()
+
+
+def _fill(digest, compute):
+    key, lock_key = CACHE_KEY.format(digest), FILL_LOCK_KEY.format(digest)
+
+    if redis_client.set(lock_key, 1, nx=True, ex=Config.RESPONSE_CACHE_LOCK_TIMEOUT):
+        try:
+            cached = _encode(compute())
+            redis_client.set(key, cached, ex=Config.RESPONSE_CACHE_TTL)
+            return cached
+        finally:
+            redis_client.delete(lock_key)
+
+    # Another request is computing this response, wait for it rather than repeat the work
+    deadline = time.monotonic() + Config.RESPONSE_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.01)
+        cached = redis_client.get(key)
+        if cached is not None:
+            return cached
+
+    return _encode(compute())
+
+
+def _entry(body):
+    return body, _etag(body)
+
+
+def _encode(body):
+    # Stored as "<etag>\n<body>" so a hit needs a single GET
+    return _etag(body).encode() + b'\n' + body
+
+
+def _etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def _digest(parts):
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
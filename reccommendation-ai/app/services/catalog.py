@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import timedelta
+
+from app.config import Config
+from app.models import product_collection
+
+# Fields kept per product, and the only ones a `fields=` projection may ask for
+CATALOG_FIELDS = ('product_id', 'product_name', 'category', 'created_at')
+
+
+class CatalogSnapshot:
+    """
+    Per-worker product_id -> compact record map used to hydrate recommendations.
+
+    At most once per `refresh_interval` seconds the collection's document
+    count and newest updated_at are compared with the snapshot's; products
+    written since are loaded incrementally, a shrinking collection triggers a
+    full reload that replaces the map in a single assignment. Ids missing from
+    the snapshot are read from MongoDB and added to it. A failed refresh keeps
+    serving the current snapshot.
+    """
+
+    def __init__(self, collection, refresh_interval=5.0):
+        self._collection = collection
+        self._refresh_interval = refresh_interval
+        self._records = {}
+        self._state = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, product_ids, fields=None):
+        """Records for `product_ids` in the given order, unknown ids skipped."""
+        self._refresh_if_due()
+        records = self._records
+
+        missing = [product_id for product_id in product_ids if product_id not in records]
+        if missing:
+            records.update(self._load({'product_id': {'$in': missing}}))
+
+        hydrated = []
+        for product_id in product_ids:
+            record = records.get(product_id)
+            if record is not None:
+                hydrated.append(record if fields is None else {field: record.get(field) for field in fields})
+        return hydrated
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self._refresh_interval:
+            return
+
+        # One thread refreshes while the others keep reading the current snapshot
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"Failed to refresh the product catalog snapshot: {e}")
+        finally:
+            self._checked_at = time.monotonic()
+            self._lock.release()
+
+    def _refresh(self):
+        count = self._collection.estimated_document_count()
+        latest = self._collection.find_one({}, {'_id': 0, 'updated_at': 1}, sort=[('updated_at', -1)])
+        watermark = latest.get('updated_at') if latest else None
+        state = (count, watermark)
+
+        if state == self._state:
+            return
+
+        if self._state is None or count < self._state[0] or self._state[1] is None:
+            self._records = dict(self._load({}))
+        else:
+            # Re-read a grace window behind the watermark for writes that committed late
+            since = self._state[1] - timedelta(seconds=Config.WATERMARK_GRACE_SECONDS)
+            written = self._load({'updated_at': {'$gt': since}})
+            self._records.update(written)
+
+        self._state = state
+
+    def _load(self, query):
+        projection = {'_id': 0, **{field: 1 for field in CATALOG_FIELDS}}
+        for doc in self._collection.find(query, projection, batch_size=10000):
+            yield doc.get('product_id'), _compact(doc)
+
+
+def _compact(doc):
+    record = {field: doc.get(field) for field in CATALOG_FIELDS}
+    if record['created_at'] is not None:
+        record['created_at'] = record['created_at'].isoformat()
+    return record
+
+
+catalog = CatalogSnapshot(product_collection, Config.CATALOG_REFRESH_INTERVAL)
@@ -1,58 +1,264 @@
-import pandas as pd, os, joblib
-from sklearn.cluster import KMeans
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+import numpy as np
 
-from app.models import product_collection
+from app.config import Config
+from app.models import product_collection, iter_product_categories, iter_product_views
+from app.services.artifacts import (current_version, load_artifact, save_artifact,
+                                    id_array, sort_order, find_rows)
+from app.services.registry import registry
 
-def train_model(model_path='ai-models/plain_category_fit_model.pkl', num_clusters=5):
-    # Connect to MongoDB
+model_name = 'plain_category'
+
+def train_model(model_name=model_name, num_clusters=5, full=False, fingerprint=None):
+    run_info = {'fingerprint': fingerprint, 'started': time.monotonic()}
+    checkpoint = None if full else _load_checkpoint(model_name)
     
-    collection = product_collection
+    if checkpoint is None:
+        return _full_refit(model_name, num_clusters, run_info)
     
-    # Fetch product data from MongoDB
-    data = pd.DataFrame(list(collection.find()))
+    return _partial_fit(model_name, checkpoint, num_clusters, run_info)
+
+
+def _full_refit(model_name, num_clusters, run_info):
+    # scikit-learn is only needed by the training worker, never on the serving path
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.cluster import MiniBatchKMeans
     
-    # Extract the 'id' and 'category' fields
-    product_data = data[['product_id', 'category']].dropna()
+    # Stream only the product_id, category and timestamp fields from MongoDB
+    product_ids, categories, _, watermark = _fetch_products()
+    if len(product_ids) < num_clusters:
+        print("Not enough products to train the category model.")
+        return
 
     # Vectorize the 'category' field
     vectorizer = TfidfVectorizer()
-    category_matrix = vectorizer.fit_transform(product_data['category'])
+    category_matrix = vectorizer.fit_transform(categories)
 
-    # Train the K-Means model
-    kmeans = KMeans(n_clusters=num_clusters, random_state=42)
+    # Train the mini-batch K-Means model, later runs continue it with partial_fit
+    kmeans = MiniBatchKMeans(n_clusters=num_clusters, random_state=42, n_init=3)
     kmeans.fit(category_matrix)
     
-    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    category_products = defaultdict(list)
+    for product_id, category in zip(product_ids, categories):
+        category_products[category].append(product_id)
+    
+    _save(model_name, kmeans, vectorizer, dict(category_products), watermark, dict(run_info, mode='full'))
+
+
+def _partial_fit(model_name, checkpoint, num_clusters, run_info):
+    # Only products added or re-categorised since the last run, plus a grace
+    # window behind its watermark for writes committed after that run read them
+    trained_at = checkpoint['trained_at']
+    product_ids, categories, written_at, watermark = _fetch_products(
+        updated_after=trained_at - timedelta(seconds=Config.WATERMARK_GRACE_SECONDS))
+    if not product_ids:
+        return
+    
+    vectorizer = checkpoint['vectorizer']
+    kmeans = checkpoint['model']
+    category_matrix = vectorizer.transform(categories)
+    
+    # A category made only of unseen words cannot be placed by the frozen vocabulary
+    if (category_matrix.getnnz(axis=1) == 0).any():
+        print("New category vocabulary found, running a full category model refit.")
+        return _full_refit(model_name, num_clusters, run_info)
+    
+    # Grace window rows may already have been fitted by the last run, partial_fit
+    # would count them twice; they only refresh the category placements below
+    new_rows = [row for row, written in enumerate(written_at) if written is None or written > trained_at]
+    placed = {product_id: category for category, products in checkpoint['category_products'].items()
+              for product_id in products}
+    if not new_rows and all(placed.get(product_id) == category
+                            for product_id, category in zip(product_ids, categories)):
+        return
+    if new_rows:
+        kmeans.partial_fit(category_matrix[new_rows])
+    
+    # Products written again may have moved category, drop their old placement
+    changed = set(product_ids)
+    category_products = {}
+    for category, products in checkpoint['category_products'].items():
+        products = [product_id for product_id in products if product_id not in changed]
+        if products:
+            category_products[category] = products
+    
+    for product_id, category in dict(zip(product_ids, categories)).items():
+        category_products.setdefault(category, []).append(product_id)
+    
+    # The re-read window may hold nothing newer than the previous watermark
+    watermark = max(watermark, trained_at) if watermark else trained_at
+    _save(model_name, kmeans, vectorizer, category_products, watermark,
+          dict(run_info, mode='incremental'))
+
+
+def _fetch_products(updated_after=None):
+    product_ids, categories, written_at, watermark = [], [], [], None
+    for product in iter_product_categories(updated_after=updated_after):
+        product_ids.append(product['product_id'])
+        categories.append(product['category'])
+        # Products stored before upserts existed only have created_at
+        written = product.get('updated_at') or product.get('created_at')
+        written_at.append(written)
+        if written is not None and (watermark is None or written > watermark):
+            watermark = written
+    return product_ids, categories, written_at, watermark
+
+
+def _load_checkpoint(model_name):
+    if current_version(model_name) is None:
+        return None
+    
+    # Versions watermarked by created_at predate product upserts and are refit from scratch
+    artifact = load_artifact(model_name)
+    if artifact.manifest.get('watermark') != 'updated_at':
+        return None
+    return dict(artifact.objects(), trained_at=datetime.fromisoformat(artifact.manifest['trained_at']))
 
-    # Save the trained model and vectorizer using joblib
-    joblib.dump({'model': kmeans, 'vectorizer': vectorizer}, model_path)
+
+def _save(model_name, kmeans, vectorizer, category_products, watermark, run_info):
+    # Centroids may have moved, so every known category is re-placed before
+    # rebuilding the cluster -> product ids and category -> cluster lookups
+    categories = np.array(sorted(category_products), dtype=str)
+    category_clusters = kmeans.predict(vectorizer.transform(categories)).astype(np.int32)
+    
+    clusters = defaultdict(list)
+    for category, cluster in zip(categories.tolist(), category_clusters.tolist()):
+        clusters[cluster].extend(category_products[category])
     
-def recommend_products(category, model_path='ai-models/plain_category_fit_model.pkl'):
-    # Load the trained model and vectorizer
-    model_data = joblib.load(model_path)
-    kmeans = model_data['model']
-    vectorizer = model_data['vectorizer']
+    # Cluster members laid out contiguously, cluster c spans offsets[c]:offsets[c + 1],
+    # each cluster ranked by popularity so a page is a plain slice
+    views = {row['product_id']: row['views'] for row in iter_product_views()}
+    ranked = [
+        sorted(clusters.get(cluster, []), key=lambda product_id: -views.get(product_id, 0))
+        for cluster in range(kmeans.n_clusters)
+    ]
+    cluster_offsets = np.concatenate([[0], np.cumsum([len(members) for members in ranked])]).astype(np.int64)
+    cluster_products = id_array([product_id for members in ranked for product_id in members])
+    cluster_scores = np.array([views.get(product_id, 0) for members in ranked for product_id in members],
+                              dtype=np.float32)
     
-    collection = collection = product_collection
+    # Vocabulary, idf weights and centroids let serving place unseen categories
+    # with plain NumPy; terms are sorted for binary search
+    terms = np.array(sorted(vectorizer.vocabulary_), dtype=str)
+    columns = np.array([vectorizer.vocabulary_[term] for term in terms.tolist()], dtype=np.int32)
     
-    # Fetch product data from MongoDB
-    data = pd.DataFrame(list(collection.find()))
-    product_data = data[['product_id', 'category']].dropna()
+    # Save the serving index as mmappable arrays and the model/vectorizer as the
+    # training checkpoint; `trained_at` is the newest product updated_at seen,
+    # anything after it is a late arrival
+    save_artifact(model_name, {
+        'categories': categories,
+        'category_clusters': category_clusters,
+        'cluster_offsets': cluster_offsets,
+        'cluster_products': cluster_products,
+        'cluster_scores': cluster_scores,
+        'vocabulary_terms': terms,
+        'vocabulary_columns': columns,
+        'idf': vectorizer.idf_.astype(np.float32),
+        'centroids': kmeans.cluster_centers_.astype(np.float32),
+    }, objects={
+        'model': kmeans,
+        'vectorizer': vectorizer,
+        'category_products': category_products,
+    }, manifest={
+        'mode': run_info['mode'],
+        'fingerprint': run_info['fingerprint'],
+        'products': len(cluster_products),
+        'categories': len(categories),
+        'clusters': kmeans.n_clusters,
+        'lowercase': vectorizer.lowercase,
+        'token_pattern': vectorizer.token_pattern,
+        'watermark': 'updated_at',
+        'trained_at': watermark.isoformat(),
+        'training_seconds': round(time.monotonic() - run_info['started'], 3),
+    })
+
+
+def _predict_cluster(model, category):
+    # Known category strings are a binary search in the sorted categories array
+    row = find_rows(model['categories'], [category])[0]
+    if row >= 0:
+        return int(model['category_clusters'][row])
     
-    # Get the category of the selected product
-    selected_category = category
+    # Unseen category string, place it on its nearest centroid
+    centroids = model['centroids']
+    distances = (centroids ** 2).sum(axis=1) - 2 * (centroids @ _category_vector(model, category))
+    return int(np.argmin(distances))
+
+
+def _category_vector(model, category):
+    # Same tokenization and l2-normalised tf-idf weighting as the fitted TfidfVectorizer
+    if model.manifest['lowercase']:
+        category = category.lower()
+    tokens = re.findall(model.manifest['token_pattern'], category)
     
-    # Vectorize the category of the selected product
-    category_vector = vectorizer.transform([selected_category])
+    rows = find_rows(model['vocabulary_terms'], tokens)
+    vector = np.zeros(len(model['idf']), dtype=np.float32)
+    np.add.at(vector, model['vocabulary_columns'][rows[rows >= 0]], 1)
+    vector *= model['idf']
     
-    # Predict the cluster for the selected product
-    selected_cluster = kmeans.predict(category_vector)[0]
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def assign_cluster(category, model_name=model_name):
+    """
+    (nearest cluster, model version) for a newly inserted product, (None, None)
+    until a model exists. Cluster numbers are only meaningful to the version
+    that assigned them, a refit may renumber clusters.
+    """
+    if not isinstance(category, str):
+        return None, None
+    try:
+        model = registry.get(model_name)
+    except FileNotFoundError:
+        return None, None
+    return _predict_cluster(model, category), model.version
+
+    
+def recommend_products(category, limit=None, offset=0, model_name=model_name):
+    return recommend_many([category], limit, offset, model_name)[0]
+
+
+def recommend_many(categories, limit=None, offset=0, model_name=model_name):
+    """
+    Products of each category's cluster, most viewed first, `limit` from `offset`.
+
+    Products written after training follow the ranked members, newest last.
+    """
+    # Get the trained model and its cluster index from the in-memory registry
+    model = registry.get(model_name)
+    trained_at = datetime.fromisoformat(model.manifest['trained_at'])
+    offsets = model['cluster_offsets']
+    selected_clusters = [_predict_cluster(model, category) for category in categories]
     
-    # Find other products in the same cluster
-    product_data['cluster'] = kmeans.predict(vectorizer.transform(product_data['category']))
-    recommended_products = product_data[product_data['cluster'] == selected_cluster]
+    pages = {}
+    for cluster in set(selected_clusters):
+        start, end = offsets[cluster], offsets[cluster + 1]
+        stop = end if limit is None else min(end, start + offset + limit)
+        page = model['cluster_products'][min(start + offset, end):stop].tolist()
+        
+        # Products written after training were stamped with their cluster and
+        # the version that assigned it on write, stamps from other versions are
+        # ignored; they are only read when the page runs past the ranked members
+        remaining = None if limit is None else limit - len(page)
+        if remaining is None or remaining > 0:
+            late_arrivals = [doc['product_id'] for doc in product_collection.find(
+                {'cluster_version': model.version, 'cluster': cluster, 'updated_at': {'$gt': trained_at}},
+                {'_id': 0, 'product_id': 1},
+            ).sort('updated_at', 1)]
+            
+            # Members re-written since training are already ranked, only the
+            # rest are paged after them
+            members = model['cluster_products'][start:end]
+            ranked = find_rows(members, late_arrivals, sort_order(members)) >= 0
+            late_arrivals = [product_id for product_id, known in zip(late_arrivals, ranked.tolist()) if not known]
+            
+            skip = int(max(0, start + offset - end))
+            page.extend(late_arrivals[skip:] if remaining is None else late_arrivals[skip:skip + remaining])
+        pages[cluster] = page
 
-    return  recommended_products['product_id'].tolist()
\ No newline at end of file
+    return [list(pages[cluster]) for cluster in selected_clusters]
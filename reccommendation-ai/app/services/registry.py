@@ -0,0 +1,89 @@
+import threading
+import time
+
+from app.services.artifacts import current_version, load_artifact
+
+
+class _Entry:
+    __slots__ = ('version', 'model', 'checked_at')
+
+    def __init__(self, version, model, checked_at):
+        self.version = version
+        self.model = model
+        self.checked_at = checked_at
+
+
+class ModelRegistry:
+    """
+    Keeps loaded model artifacts in memory for the lifetime of the worker.
+
+    At most once per `check_interval` seconds the model's `current` version
+    pointer is read, and the artifact is reloaded only when it points at a
+    new version. A reload replaces the cached entry in a single assignment,
+    so a request either gets the previous model or the new one, never a
+    partially loaded one. If a reload fails the previous model keeps being
+    served.
+    """
+
+    def __init__(self, loader=load_artifact, resolver=current_version, check_interval=1.0):
+        self._loader = loader
+        self._resolver = resolver
+        self._check_interval = check_interval
+        self._entries = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        now = time.monotonic()
+
+        if entry is not None and now - entry.checked_at < self._check_interval:
+            return entry.model
+
+        version = self._resolver(name)
+        if version is None:
+            if entry is None:
+                raise FileNotFoundError(f"The model {name} has no trained version. Train the model first.")
+            return entry.model
+
+        if entry is not None and entry.version == version:
+            self._entries[name] = _Entry(version, entry.model, now)
+            return entry.model
+
+        return self._reload(name, version)
+
+    def version(self, name):
+        entry = self._entries.get(name)
+        return entry.version if entry is not None else None
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._entries = {}
+        else:
+            self._entries.pop(name, None)
+
+    def _reload(self, name, version):
+        with self._lock_for(name):
+            # Another thread may have loaded this version while we waited
+            entry = self._entries.get(name)
+            if entry is not None and entry.version == version:
+                return entry.model
+
+            try:
+                model = self._loader(name, version)
+            except Exception as e:
+                if entry is None:
+                    raise
+                print(f"Failed to load model {name} version {version}, serving previous version: {e}")
+                self._entries[name] = _Entry(entry.version, entry.model, time.monotonic())
+                return entry.model
+
+            self._entries[name] = _Entry(version, model, time.monotonic())
+            return model
+
+    def _lock_for(self, name):
+        with self._guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+
+registry = ModelRegistry()
@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+# Matrix shared with pool workers, set once per worker by the initializer
+_worker_matrix = None
+
+
+def top_k_similar(normalized, rows, top_k, workers=None, memory_budget_mb=256):
+    """
+    Exact cosine top-k neighbors of `rows` against every row of `normalized`.
+
+    `rows` is split into blocks whose dense similarity slab fits within
+    `memory_budget_mb`, and blocks are scored in a process pool of `workers`
+    processes (all cores by default). Each worker receives the matrix once.
+    Returns (neighbors, scores) with self excluded and rows padded with -1.
+    """
+    rows = np.asarray(rows)
+    if not len(rows):
+        return np.empty((0, top_k), dtype=np.int32), np.empty((0, top_k), dtype=np.float32)
+
+    blocks = _split_blocks(rows, normalized.shape[0], memory_budget_mb)
+    results = _run_blocks(normalized, workers, block_top_k, blocks, [top_k] * len(blocks))
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def merge_changed_neighbors(normalized, neighbors, scores, affected, workers=None, memory_budget_mb=256):
+    """
+    Fold the new similarities of the changed `affected` rows into the
+    neighbor lists of every other row, in place.
+
+    Only rows sharing a column with an affected row can change. They are
+    split into blocks whose similarity slab against `affected` fits within
+    `memory_budget_mb` and merged in the process pool like `top_k_similar`.
+    """
+    affected = np.asarray(affected)
+    if not len(affected):
+        return
+
+    shared = np.zeros(normalized.shape[1], dtype=np.float32)
+    shared[normalized[affected].indices] = 1
+    touched = np.flatnonzero(normalized @ shared)
+    touched = touched[~np.isin(touched, affected)]
+    if not len(touched):
+        return
+
+    blocks = _split_blocks(touched, len(affected), memory_budget_mb)
+    results = _run_blocks(
+        normalized, workers, block_merge_changed, blocks, [affected] * len(blocks),
+        [neighbors[block] for block in blocks], [scores[block] for block in blocks],
+    )
+    for block, (block_neighbors, block_scores) in zip(blocks, results):
+        neighbors[block] = block_neighbors
+        scores[block] = block_scores
+
+
+def block_top_k(normalized, rows, top_k):
+    # Cosine similarity of the given rows against every product, self excluded
+    similarities = (normalized[rows] @ normalized.T).toarray()
+    similarities[np.arange(len(rows)), rows] = 0
+
+    k = min(top_k, similarities.shape[1])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    # Products with no co-viewers are not neighbors, rows are padded with -1
+    neighbors = np.full((len(rows), top_k), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), top_k), dtype=np.float32)
+    neighbors[:, :k] = np.where(top_scores > 0, top, -1)
+    scores[:, :k] = np.where(top_scores > 0, top_scores, 0)
+
+    return neighbors, scores
+
+
+def block_merge_changed(normalized, rows, affected, neighbors, scores):
+    """
+    Neighbor lists of `rows` with their entries for `affected` replaced by
+    the new similarities and re-ranked. `neighbors` and `scores` hold the
+    current lists of `rows` and are modified in place.
+    """
+    top_k = neighbors.shape[1]
+    similarities = (normalized[rows] @ normalized[affected].T).tocsr()
+    stale = np.isin(neighbors, affected)
+
+    for i in range(len(rows)):
+        start, end = similarities.indptr[i], similarities.indptr[i + 1]
+        keep = (neighbors[i] >= 0) & ~stale[i]
+
+        candidates = np.concatenate([neighbors[i][keep], affected[similarities.indices[start:end]]])
+        candidate_scores = np.concatenate([scores[i][keep], similarities.data[start:end]])
+        order = np.argsort(-candidate_scores, kind='stable')[:top_k]
+
+        neighbors[i] = -1
+        scores[i] = 0
+        neighbors[i, :len(order)] = candidates[order]
+        scores[i, :len(order)] = candidate_scores[order]
+
+    return neighbors, scores
+
+
+def _run_blocks(normalized, workers, function, blocks, *arguments):
+    # function(normalized, block, *block_arguments) for every block, in a
+    # process pool that receives the matrix once per worker
+    workers = min(workers or os.cpu_count() or 1, len(blocks))
+
+    # Daemonic processes (e.g. a prefork Celery child) may not start a pool
+    if workers <= 1 or multiprocessing.current_process().daemon:
+        return [function(normalized, *block_arguments) for block_arguments in zip(blocks, *arguments)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(normalized,)) as pool:
+        return list(pool.map(partial(_in_worker, function), blocks, *arguments))
+
+
+def _split_blocks(rows, n_columns, memory_budget_mb):
+    # Dense float32 slab, its negated copy and argpartition's int64 indices
+    bytes_per_row = max(n_columns, 1) * (4 + 4 + 8)
+    block_rows = max(1, (memory_budget_mb * 1024 * 1024) // bytes_per_row)
+    return [rows[start:start + block_rows] for start in range(0, len(rows), block_rows)]
+
+
+def _init_worker(normalized):
+    global _worker_matrix
+    _worker_matrix = normalized
+
+
+def _in_worker(function, *arguments):
+    return function(_worker_matrix, *arguments)
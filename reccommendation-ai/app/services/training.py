@@ -0,0 +1,91 @@
+from flask import current_app
+from redis.exceptions import LockError
+
+from app import redis_client
+from app.config import Config
+from app.services.artifacts import load_manifest
+
+PENDING_KEY = 'ai:training:{}:pending'
+LOCK_KEY = 'ai:training:{}:lock'
+RERUN_KEY = 'ai:training:{}:rerun'
+
+# model name -> (celery task, early-trigger threshold)
+TRAINING_TASKS = {
+    'category': ('train_category_model_task', Config.CATEGORY_TRAINING_THRESHOLD),
+    'interaction': ('train_interaction_model_task', Config.INTERACTION_TRAINING_THRESHOLD),
+}
+
+
+def collection_fingerprint(collection, field='created_at'):
+    # Document count plus newest `field` timestamp, both cheap to read
+    latest = collection.find_one({}, {'_id': 0, field: 1}, sort=[(field, -1)])
+    latest_at = latest[field].isoformat() if latest and latest.get(field) else ''
+    return f"{collection.estimated_document_count()}:{latest_at}"
+
+
+def train_if_changed(model_name, collection, artifact_name, train, force=False, field='created_at'):
+    """
+    Run `train(fingerprint)` unless the source collection is unchanged since
+    the fingerprint recorded in the current artifact's manifest.
+
+    Returns 'skipped' when training was not needed, 'trained' otherwise.
+    """
+    fingerprint = collection_fingerprint(collection, field)
+    manifest = load_manifest(artifact_name)
+    
+    if not force and manifest is not None and manifest.get('fingerprint') == fingerprint:
+        return 'skipped'
+    
+    # Changes recorded from here on count towards the next early run
+    redis_client.delete(PENDING_KEY.format(model_name))
+    train(fingerprint)
+    return 'trained'
+
+
+def run_training(model_name, collection, artifact_name, train, full=False, field='created_at'):
+    """
+    Single-flight wrapper around `train_if_changed`, one run per model at a time.
+
+    A trigger that arrives while a run holds the lock is coalesced into a
+    rerun flag instead of queueing another run; the lock holder runs once
+    more when it finishes. A coalesced full=True trigger keeps its full flag.
+    """
+    lock = redis_client.lock(LOCK_KEY.format(model_name), timeout=Config.TRAINING_LOCK_TIMEOUT)
+    rerun_key = RERUN_KEY.format(model_name)
+    
+    if not lock.acquire(blocking=False):
+        if full:
+            redis_client.set(rerun_key, 'full', ex=Config.TRAINING_LOCK_TIMEOUT)
+        else:
+            redis_client.set(rerun_key, 'incremental', ex=Config.TRAINING_LOCK_TIMEOUT, nx=True)
+        return 'coalesced'
+    
+    try:
+        while True:
+            result = train_if_changed(
+                model_name, collection, artifact_name,
+                lambda fingerprint: train(full=full, fingerprint=fingerprint), force=full, field=field,
+            )
+            rerun = redis_client.getdel(rerun_key)
+            if rerun is None:
+                return result
+            full = rerun == b'full'
+            lock.reacquire()
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # Lock expired during a very long run, nothing left to release
+            pass
+
+
+def record_changes(model_name, count=1):
+    """Count new source documents and queue training once the threshold is crossed."""
+    task_name, threshold = TRAINING_TASKS[model_name]
+    try:
+        pending = redis_client.incrby(PENDING_KEY.format(model_name), count)
+        if pending >= threshold > pending - count:
+            current_app.extensions['celery'].send_task(task_name)
+    except Exception as e:
+        # fail silently, the beat schedule still picks the changes up
+        print(f"Failed to record training changes: {e}")
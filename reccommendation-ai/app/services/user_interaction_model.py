@@ -1,61 +1,379 @@
-import pandas as pd, os, joblib
-from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
-from app.models import product_interactions
+import numpy as np, time
+from array import array
+from datetime import datetime, timedelta
+from app.config import Config
+from app.models import iter_interaction_counts, latest_interaction_at
+from app.services.ann import RandomProjectionLSH
+from app.services.similarity import top_k_similar, merge_changed_neighbors
+from app.services.artifacts import (current_version, load_artifact, save_artifact,
+                                    id_array, sort_order, find_rows)
+from app.services.registry import registry
 
-model_path = 'ai-models/user_cat_intaraction_model.pkl'
+model_name = 'user_interaction'
 
-def train_model(model_path=model_path):
-    interactions = product_interactions.find()
+# Above this share of changed products an incremental run recomputes every neighbor list
+FULL_NEIGHBOR_REBUILD_RATIO = 0.25
+
+def train_model(model_name=model_name, top_k=20, full=False, fingerprint=None):
+    run_info = {'fingerprint': fingerprint, 'started': time.monotonic()}
     
-    # Create DataFrame for user-product interactions
-    data = pd.DataFrame(list(interactions))
-    if data.empty:
+    # Interactions up to this watermark are covered by the model, later ones by the next run
+    watermark = latest_interaction_at()
+    if watermark is None:
         print("No interaction data found.")
         return
-    
-    # Create user-product interaction matrix (sparse format)
-    user_product_matrix = data.pivot_table(index='product_id', columns='user_id', aggfunc='size', fill_value=0)
-    user_product_matrix_sparse = csr_matrix(user_product_matrix)
-    
-    # Train KNN model using sparse matrix
-    model = NearestNeighbors(metric='cosine', algorithm='brute')
-    model.fit(user_product_matrix_sparse)
-    
-    # Save the model
-    os.makedirs(os.path.dirname(model_path), exist_ok=True)
-    
-    joblib.dump({'model': model, 'matrix': user_product_matrix}, model_path) # Save model with matrix
 
+    checkpoint = None if full else _load_checkpoint(model_name)
 
-def recommend_products(product_id, category, n_recommendations=5):
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"The model file {model_path} does not exist. Train the model first.")
-    
-    # Load model and matrix
-    model_data = joblib.load(model_path)
-    model = model_data['model']
-    user_product_matrix = model_data['matrix']
-   
-    
-    # # Ensure product exists in the filtered matrix
-    if product_id not in user_product_matrix.index:
-        return []
-        
-    # Find index of the product in the original matrix
-    user_index = user_product_matrix.index.get_loc(product_id)
-    
-    # Reshape product interaction vector to pass to the model
-    product_vector = csr_matrix(user_product_matrix.iloc[user_index, :].values.reshape(1, -1))
+    if checkpoint is None:
+        return _full_build(model_name, top_k, watermark, run_info)
+
+    return _incremental_update(model_name, top_k, checkpoint, watermark, run_info)
+
+
+def _full_build(model_name, top_k, watermark, run_info):
+    # Stream (product, user, count) rows aggregated by MongoDB into compact code arrays
+    rows = iter_interaction_counts(created_until=watermark)
+    product_ids, user_ids, product_categories, product_codes, user_codes, counts = _encode_interactions(rows, [], [])
+    if not counts:
+        print("No interaction data found.")
+        return
+
+    # Build the product x user count matrix straight from integer-coded ids,
+    # memory scales with the number of interactions rather than products x users
+    user_product_matrix = _interaction_matrix(product_codes, user_codes, len(product_ids), len(user_ids), counts)
+
+    # Precompute the top-K most similar products for every product
+    normalized = _normalize_rows(user_product_matrix)
+    index = _neighbor_index(normalized)
+    neighbors, scores = _top_k_rows(normalized, np.arange(len(product_ids)), top_k, index)
+
+    # And the top-K within each product's own category partition
+    category_neighbors = np.full_like(neighbors, -1)
+    category_scores = np.zeros_like(scores)
+    _update_partitions(normalized, product_categories, category_neighbors, category_scores, top_k)
+
+    _save(model_name, product_ids, user_ids, product_categories, user_product_matrix,
+          (neighbors, scores, category_neighbors, category_scores), watermark,
+          dict(run_info, mode='full', search=_search_name(index)))
+
+
+def _incremental_update(model_name, top_k, checkpoint, watermark, run_info):
+    # Only the pairs seen since the previous run, plus a grace window behind its
+    # watermark for counters committed after that run read them
+    rows = iter_interaction_counts(
+        created_after=checkpoint['trained_at'] - timedelta(seconds=Config.WATERMARK_GRACE_SECONDS),
+        created_until=watermark,
+    )
+    product_ids = checkpoint['product_ids'].tolist()
+    user_ids = checkpoint['user_ids'].tolist()
+    previous_categories = checkpoint['product_categories']
+    n_products = len(product_ids)
+
+    product_ids, user_ids, product_categories, product_codes, user_codes, counts = _encode_interactions(
+        rows, product_ids, user_ids, previous_categories)
+    if not counts:
+        _save(model_name, product_ids, user_ids, product_categories, checkpoint['matrix'],
+              (checkpoint['neighbors'], checkpoint['scores'],
+               checkpoint['category_neighbors'], checkpoint['category_scores']),
+              watermark, dict(run_info, mode='incremental', search=checkpoint['search']))
+        return
+
+    # Counters are running totals, so changed pairs replace their persisted value
+    # instead of adding to it; the matrix grows for new products/users
+    user_product_matrix = checkpoint['matrix'].copy()
+    user_product_matrix.resize((len(product_ids), len(user_ids)))
+    changed = _interaction_matrix(product_codes, user_codes, len(product_ids), len(user_ids))
+    user_product_matrix = user_product_matrix - user_product_matrix.multiply(changed) + _interaction_matrix(
+        product_codes, user_codes, len(product_ids), len(user_ids), counts)
+    user_product_matrix.eliminate_zeros()
+
+    neighbors = _pad_rows(checkpoint['neighbors'], len(product_ids), -1)
+    scores = _pad_rows(checkpoint['scores'], len(product_ids), 0)
+    category_neighbors = _pad_rows(checkpoint['category_neighbors'], len(product_ids), -1)
+    category_scores = _pad_rows(checkpoint['category_scores'], len(product_ids), 0)
+
+    normalized = _normalize_rows(user_product_matrix)
+    index = _neighbor_index(normalized)
+    affected = np.unique(np.frombuffer(product_codes, dtype=np.int32))
+
+    if len(affected) > FULL_NEIGHBOR_REBUILD_RATIO * len(product_ids):
+        neighbors, scores = _top_k_rows(normalized, np.arange(len(product_ids)), top_k, index)
+        _update_partitions(normalized, product_categories, category_neighbors, category_scores, top_k)
+    else:
+        _update_neighbors(normalized, neighbors, scores, affected, top_k, index)
+        # Only partitions that gained, lost or changed a product are recomputed
+        changed = {product_categories[row] for row in affected.tolist()}
+        changed.update(previous_categories[row] for row in affected.tolist() if row < n_products)
+        _update_partitions(normalized, product_categories, category_neighbors, category_scores, top_k, changed)
+
+    print(f"Interaction model updated: {len(affected)} products changed, "
+          f"{len(product_ids) - n_products} new.")
+    _save(model_name, product_ids, user_ids, product_categories, user_product_matrix,
+          (neighbors, scores, category_neighbors, category_scores), watermark,
+          dict(run_info, mode='incremental', search=_search_name(index)))
+
+
+def _update_neighbors(normalized, neighbors, scores, affected, top_k, index=None):
+    """
+    Refresh neighbor lists in place after the rows in `affected` changed.
+
+    Changed products get their list recomputed against the whole catalog. Every
+    other product that shares a user with a changed one has the stale entries
+    for changed products replaced by their new scores and is re-ranked. Entries
+    that fell out of a top-K list earlier are not recovered; the periodic full
+    rebuild takes care of that drift.
+    """
+    neighbors[affected], scores[affected] = _top_k_rows(normalized, affected, top_k, index)
+
+    # Block-wise within the similarity memory budget, across the training pool
+    merge_changed_neighbors(
+        normalized, neighbors, scores, affected,
+        workers=Config.TRAINING_WORKERS, memory_budget_mb=Config.SIMILARITY_MEMORY_MB,
+    )
+
+
+def _update_partitions(normalized, product_categories, neighbors, scores, top_k, categories=None):
+    """
+    Recompute the within-category neighbor lists in place for `categories`
+    (all of them by default). Each partition is searched on its own rows only,
+    so a category query never touches products outside it.
+    """
+    partitions, uncategorized = {}, []
+    for row, category in enumerate(product_categories):
+        if not category:
+            uncategorized.append(row)
+        elif categories is None or category in categories:
+            partitions.setdefault(category, []).append(row)
+
+    neighbors[uncategorized] = -1
+    scores[uncategorized] = 0
+
+    for rows in partitions.values():
+        rows = np.asarray(rows, dtype=np.int32)
+        partition = normalized[rows]
+        local_neighbors, local_scores = _top_k_rows(
+            partition, np.arange(len(rows)), top_k, _neighbor_index(partition))
+        neighbors[rows] = np.where(local_neighbors >= 0, rows[local_neighbors], -1)
+        scores[rows] = local_scores
+
+
+def _load_checkpoint(model_name):
+    from scipy.sparse import csr_matrix
     
-    # Adjust n_neighbors to avoid exceeding available samples
-    n_samples_fit = user_product_matrix.shape[0]
-    adjusted_n_neighbors = min(n_recommendations + 1, n_samples_fit)  # Ensure n_neighbors <= n_samples_fit
+    if current_version(model_name) is None:
+        return None
+
+    artifact = load_artifact(model_name)
+    manifest = artifact.manifest
+    # Versions saved before category partitions or pair counters existed are rebuilt from scratch
+    if 'category_neighbors' not in artifact.arrays or manifest.get('source') != 'counters':
+        return None
+
+    category_names = artifact['category_names'].tolist()
+    return {
+        'product_ids': artifact['product_ids'],
+        'user_ids': artifact['user_ids'],
+        'neighbors': artifact['neighbors'],
+        'scores': artifact['scores'],
+        'product_categories': [
+            category_names[code] if code >= 0 else '' for code in artifact['product_categories'].tolist()
+        ],
+        'category_neighbors': artifact['category_neighbors'],
+        'category_scores': artifact['category_scores'],
+        'matrix': csr_matrix(
+            (artifact['matrix_data'], artifact['matrix_indices'], artifact['matrix_indptr']),
+            shape=tuple(manifest['matrix_shape']),
+        ),
+        'trained_at': datetime.fromisoformat(manifest['trained_at']),
+        'search': manifest.get('search', 'exact'),
+    }
 
-    # Predict nearest neighbors
-    distances, indices = model.kneighbors(product_vector, n_neighbors=adjusted_n_neighbors)
+
+def _save(model_name, product_ids, user_ids, product_categories, user_product_matrix, tables, watermark, run_info):
+    neighbors, scores, category_neighbors, category_scores = tables
+    product_ids = id_array(product_ids)
+    user_ids = id_array(user_ids)
+
+    # Categories are stored once, products point at them by code (-1 when unknown)
+    category_names = np.array(sorted({category for category in product_categories if category}), dtype=str)
+    categorized = np.array([bool(category) for category in product_categories], dtype=bool)
+    category_codes = np.where(categorized, np.searchsorted(category_names, product_categories), -1)
+
+    # Plain arrays the serving workers mmap; the CSR parts are only read back by training
+    arrays = {
+        'product_ids': product_ids,
+        'user_ids': user_ids,
+        'neighbors': neighbors,
+        'scores': scores,
+        'category_names': category_names,
+        'product_categories': category_codes.astype(np.int32),
+        'category_neighbors': category_neighbors,
+        'category_scores': category_scores,
+        'matrix_data': user_product_matrix.data,
+        'matrix_indices': user_product_matrix.indices,
+        'matrix_indptr': user_product_matrix.indptr,
+    }
+    product_order = sort_order(product_ids)
+    if product_order is not None:
+        arrays['product_order'] = product_order
+
+    # Save the model as a new version
+    save_artifact(model_name, arrays, manifest={
+        'mode': run_info['mode'],
+        'source': 'counters',
+        'search': run_info['search'],
+        'fingerprint': run_info['fingerprint'],
+        'products': len(product_ids),
+        'users': len(user_ids),
+        'categories': len(category_names),
+        'interactions': int(user_product_matrix.nnz),
+        'matrix_shape': list(user_product_matrix.shape),
+        'trained_at': watermark.isoformat(),
+        'training_seconds': round(time.monotonic() - run_info['started'], 3),
+    })
+
+
+def _encode_interactions(rows, product_ids, user_ids, product_categories=None):
+    # Codes continue after the ids already known to the model
+    product_index = {product_id: code for code, product_id in enumerate(product_ids)}
+    user_index = {user_id: code for code, user_id in enumerate(user_ids)}
+    categories = list(product_categories or [''] * len(product_index))
+    categorized_at = {}
+    product_codes, user_codes, counts = array('i'), array('i'), array('f')
+
+    for row in rows:
+        product_code = product_index.setdefault(row['product_id'], len(product_index))
+        if product_code == len(categories):
+            categories.append('')
+        # A product takes the category of its newest interaction; rows are always
+        # newer than the categories already known to the model
+        if row.get('category') is not None and (
+                product_code not in categorized_at or row['last_seen'] >= categorized_at[product_code]):
+            categories[product_code] = str(row['category'])
+            categorized_at[product_code] = row['last_seen']
+
+        product_codes.append(product_code)
+        user_codes.append(user_index.setdefault(row['user_id'], len(user_index)))
+        counts.append(row['count'])
+
+    return list(product_index), list(user_index), categories, product_codes, user_codes, counts
+
+
+def _interaction_matrix(product_codes, user_codes, n_products, n_users, counts=None):
+    # SciPy is only needed by the training worker, never on the serving path
+    from scipy.sparse import coo_matrix
     
-    # Get recommended product IDs, excluding the input product itself
-    recommended_product_ids = user_product_matrix.index[indices.flatten()[1:]].tolist()
+    if counts is None:
+        counts = np.ones(len(product_codes), dtype=np.float32)
+
+    matrix = coo_matrix(
+        (np.asarray(counts, dtype=np.float32),
+         (np.asarray(product_codes, dtype=np.int32), np.asarray(user_codes, dtype=np.int32))),
+        shape=(n_products, n_users),
+    ).tocsr()
+    # Repeated (product, user) pairs are summed into a single view count
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _normalize_rows(matrix):
+    from scipy.sparse import diags
     
-    return recommended_product_ids if recommended_product_ids else []
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32).ravel())
+    norms[norms == 0] = 1
+    return (diags(1 / norms) @ matrix).tocsr().astype(np.float32)
+
+
+def _neighbor_index(normalized):
+    # Exact search is cheap enough for small catalogs and has perfect recall
+    if not Config.ANN_ENABLED or normalized.shape[0] < Config.ANN_MIN_PRODUCTS:
+        return None
+    return RandomProjectionLSH(
+        n_bits=Config.ANN_BITS, n_tables=Config.ANN_TABLES,
+        max_candidates=Config.ANN_MAX_CANDIDATES,
+    ).fit(normalized)
+
+
+def _search_name(index):
+    return 'exact' if index is None else 'lsh'
+
+
+def _top_k_rows(normalized, rows, top_k, index=None):
+    if index is not None:
+        return index.query(rows, top_k)
+
+    # Exact search runs block-wise across a process pool within a memory budget
+    return top_k_similar(
+        normalized, rows, top_k,
+        workers=Config.TRAINING_WORKERS, memory_budget_mb=Config.SIMILARITY_MEMORY_MB,
+    )
+
+
+def _pad_rows(table, n_rows, fill):
+    padded = np.full((n_rows, table.shape[1]), fill, dtype=table.dtype)
+    padded[:table.shape[0]] = table
+    return padded
+
+
+def recommend_products(product_id, category=None, n_recommendations=5, offset=0):
+    return recommend_many([product_id], category, n_recommendations, offset)[0]
+
+
+def recommend_many(product_ids, category=None, n_recommendations=5, offset=0):
+    """
+    Most similar products for each of `product_ids`, restricted to `category` when given,
+    ranked by similarity and paged with `n_recommendations` from `offset`.
+
+    All ids are resolved with one binary search and unfiltered lists are one
+    slice of the neighbor table. `category` may list several comma-separated
+    categories: the product's own category is answered from its partition's
+    neighbor list, other requested categories from the global list filtered
+    to them, and both are merged by score.
+    """
+    # Get the precomputed neighbor table from the in-memory registry (raises if never trained)
+    model = registry.get(model_name)
+
+    # Binary search over the mmapped ids, query-string ids are coerced to the stored dtype
+    ids = model['product_ids']
+    rows = find_rows(ids, product_ids, model.arrays.get('product_order'))
+
+    # Versions trained before category partitions existed only have the global list
+    requested = [name.strip() for name in str(category or '').split(',') if name.strip()]
+    if not requested or 'category_neighbors' not in model.arrays:
+        table = model['neighbors'][np.maximum(rows, 0), offset:offset + n_recommendations]
+        return [ids[neighbors[neighbors >= 0]].tolist() if row >= 0 else []
+                for row, neighbors in zip(rows.tolist(), table)]
+
+    codes = find_rows(model['category_names'], requested)
+    codes = codes[codes >= 0]
+    return [ids[_category_neighbors(model, row, codes, offset + n_recommendations)[offset:]].tolist()
+            if row >= 0 else [] for row in rows.tolist()]
+
+
+def _category_neighbors(model, row, codes, n_recommendations):
+    own = model['product_categories'][row]
+
+    candidates, candidate_scores = [], []
+    if own >= 0 and own in codes:
+        candidates.append(model['category_neighbors'][row])
+        candidate_scores.append(model['category_scores'][row])
+
+    others = codes[codes != own]
+    if len(others):
+        neighbors = model['neighbors'][row]
+        keep = neighbors >= 0
+        keep[keep] = np.isin(model['product_categories'][neighbors[keep]], others)
+        candidates.append(neighbors[keep])
+        candidate_scores.append(model['scores'][row][keep])
+
+    if not candidates:
+        return np.empty(0, dtype=np.int32)
+
+    # Merge by score, a product found in both lists is kept once
+    neighbors = np.concatenate(candidates)
+    scores = np.concatenate(candidate_scores)
+    order = np.argsort(-scores, kind='stable')
+    neighbors = neighbors[order][scores[order] > 0]
+    _, first = np.unique(neighbors, return_index=True)
+    return neighbors[np.sort(first)][:n_recommendations]
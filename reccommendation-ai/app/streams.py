@@ -0,0 +1,125 @@
+"""
+Redis Streams ingestion of interaction events.
+
+Producers append one entry per event to the INTERACTION_STREAM stream with a
+single `data` field holding the JSON event, the same object POST
+/ai/interactions accepts:
+
+    XADD ai:interactions MAXLEN ~ 1000000 * data '{"user_id": 1, "product_id": 2, "category": "shoes"}'
+
+Consumers share the INTERACTION_STREAM_GROUP consumer group, so adding
+consumers splits the stream between them. Each batch is written with one
+insert_many and acknowledged only afterwards; entries left pending by a
+consumer that died are claimed by the others once idle for
+INTERACTION_STREAM_CLAIM_IDLE_MS. Events are stored under their entry id,
+so an entry delivered twice is stored and counted once.
+"""
+
+import json
+import os
+import socket
+import time
+
+from pymongo.errors import PyMongoError
+from redis.exceptions import RedisError, ResponseError
+
+from app import redis_client
+from app.config import Config
+from app.models import save_user_interactions, validate_interaction
+from app.services.training import record_changes
+
+
+def publish_interactions(events):
+    """Append events to the stream, for producers that share this codebase."""
+    pipeline = redis_client.pipeline(transaction=False)
+    for event in events:
+        pipeline.xadd(Config.INTERACTION_STREAM, {'data': json.dumps(event)},
+                      maxlen=Config.INTERACTION_STREAM_MAXLEN, approximate=True)
+    return pipeline.execute()
+
+
+def ensure_group():
+    try:
+        redis_client.xgroup_create(Config.INTERACTION_STREAM, Config.INTERACTION_STREAM_GROUP,
+                                   id='0', mkstream=True)
+    except ResponseError as e:
+        # The group already exists
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def default_consumer_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def consume_interactions(consumer=None, batch_size=None, block_ms=None, stop=None):
+    """
+    Read, persist and acknowledge batches until `stop()` returns True.
+
+    Must run inside an application context, new interactions are reported to
+    training like the HTTP endpoints do.
+    """
+    consumer = consumer or default_consumer_name()
+    batch_size = batch_size or Config.INTERACTION_STREAM_BATCH
+    block_ms = Config.INTERACTION_STREAM_BLOCK_MS if block_ms is None else block_ms
+    ensure_group()
+    claimed_at = 0
+
+    while stop is None or not stop():
+        try:
+            # Take over entries another consumer read but never acknowledged
+            if time.monotonic() - claimed_at >= Config.INTERACTION_STREAM_CLAIM_IDLE_MS / 1000:
+                claimed_at = time.monotonic()
+                _, entries, *_ = redis_client.xautoclaim(
+                    Config.INTERACTION_STREAM, Config.INTERACTION_STREAM_GROUP, consumer,
+                    min_idle_time=Config.INTERACTION_STREAM_CLAIM_IDLE_MS, count=batch_size,
+                )
+                if entries:
+                    process_batch(entries)
+                    continue
+
+            response = redis_client.xreadgroup(
+                Config.INTERACTION_STREAM_GROUP, consumer, {Config.INTERACTION_STREAM: '>'},
+                count=batch_size, block=block_ms,
+            )
+            for _, entries in response or []:
+                process_batch(entries)
+        except RedisError as e:
+            print(f"Interaction stream unavailable, retrying: {e}")
+            time.sleep(1)
+        except PyMongoError as e:
+            # The batch stays pending and is claimed again once idle
+            print(f"Failed to persist interaction batch, retrying: {e}")
+            time.sleep(1)
+
+
+def process_batch(entries):
+    """
+    Persist one batch of stream entries and acknowledge them.
+
+    Malformed or invalid events are acknowledged and dropped, they would fail
+    again on every retry. If the write itself fails nothing is acknowledged
+    and the entries are retried once claimed.
+    """
+    entry_ids, events, event_ids = [], [], []
+    for entry_id, fields in entries:
+        entry_ids.append(entry_id)
+        try:
+            event = json.loads((fields or {}).get(b'data', b''))
+        except ValueError:
+            event = None
+        error = validate_interaction(event)
+        if error:
+            print(f"Dropping interaction stream entry {entry_id!r}: {error}")
+        else:
+            events.append(event)
+            event_ids.append(entry_id.decode() if isinstance(entry_id, bytes) else entry_id)
+
+    inserted, errors = save_user_interactions(events, ids=event_ids)
+    for _, error in errors:
+        print(f"Interaction stream event rejected by MongoDB: {error}")
+
+    redis_client.xack(Config.INTERACTION_STREAM, Config.INTERACTION_STREAM_GROUP, *entry_ids)
+    if inserted:
+        record_changes('interaction', inserted)
+    return inserted
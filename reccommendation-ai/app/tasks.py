@@ -3,14 +3,32 @@ import time
 
 from celery import shared_task
 from app.config import Config
-from app.services.user_interaction_model import train_model as category_model_train
-from app.services.plain_cat_model import train_model as interaction_model_train
+from app.models import product_collection, interaction_counters
+from app.services import plain_cat_model, user_interaction_model, als_model
+from app.services.training import run_training
 
 @shared_task(name="train_category_model_task")
-def train_category_model_task():
-    return category_model_train()
+def train_category_model_task(full=False):
+    # Incremental mini-batch update by default, full=True refits from scratch
+    return run_training(
+        'category', product_collection, plain_cat_model.model_name,
+        plain_cat_model.train_model, full=full, field='updated_at',
+    )
 
 
 @shared_task(name="train_interaction_model_task")
-def train_interaction_model_task():
-    return interaction_model_train()
+def train_interaction_model_task(full=False):
+    # Merges interactions newer than the last watermark, full=True rebuilds from zero
+    return run_training(
+        'interaction', interaction_counters, user_interaction_model.model_name,
+        user_interaction_model.train_model, full=full, field='last_seen',
+    )
+
+
+@shared_task(name="train_als_model_task")
+def train_als_model_task(full=False):
+    # Always a full ALS fit, skipped while the interactions are unchanged
+    return run_training(
+        'als', interaction_counters, als_model.model_name,
+        als_model.train_model, full=full, field='last_seen',
+    )
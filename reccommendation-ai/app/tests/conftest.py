@@ -0,0 +1,52 @@
+import os
+
+import fakeredis
+import flask_pymongo
+import mongomock
+import mongomock.collection
+import pytest
+
+os.environ.setdefault('CLIENT_HEADER_SECRET', 'test-secret')
+
+# pymongo passes `sort` to update operations, which this mongomock version does not accept
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = (
+    lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs))
+flask_pymongo.MongoClient = mongomock.MongoClient
+
+import app as app_package
+
+# Must be replaced before any module does `from app import redis_client`
+app_package.redis_client = fakeredis.FakeRedis()
+
+from app import create_app, mongo, redis_client
+from app.config import Config
+from app.services.registry import registry
+
+flask_app, celery = create_app()
+sent_tasks = []
+celery.send_task = lambda name, *args, **kwargs: sent_tasks.append(name)
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    # Fresh collections, Redis and model directory per test, training in-process
+    monkeypatch.setattr(Config, 'MODEL_DIR', str(tmp_path / 'ai-models'))
+    monkeypatch.setattr(Config, 'TRAINING_WORKERS', 1)
+    for name in mongo.db.list_collection_names():
+        mongo.db[name].delete_many({})
+    redis_client.flushall()
+    registry.invalidate()
+    sent_tasks.clear()
+    yield
+    registry.invalidate()
+
+
+@pytest.fixture
+def client():
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def headers():
+    return {'Client-Header-Secret': os.environ['CLIENT_HEADER_SECRET']}
@@ -0,0 +1,42 @@
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+from app.services import als_model
+
+
+def test_least_squares_matches_the_dense_normal_equations():
+    counts = sparse_random(30, 20, density=0.2, random_state=4, format='csr', dtype=np.float32)
+    counts.data = np.ceil(counts.data * 5)
+    fixed = np.random.default_rng(4).standard_normal((20, 6)).astype(np.float32)
+    regularization, alpha = 0.1, 40.0
+
+    solved = als_model._least_squares(counts, fixed, regularization, alpha)
+
+    dense = counts.toarray()
+    for row in range(dense.shape[0]):
+        if not dense[row].any():
+            assert not solved[row].any()
+            continue
+        confidence = np.diag(1 + alpha * dense[row])
+        preference = (dense[row] > 0).astype(np.float32)
+        expected = np.linalg.solve(fixed.T @ confidence @ fixed + regularization * np.eye(6),
+                                   fixed.T @ confidence @ preference)
+        assert np.allclose(solved[row], expected, rtol=1e-3, atol=1e-4)
+
+
+def test_user_recommendations_come_from_similar_users_and_skip_viewed(client, headers):
+    # Two audiences that never overlap; user 1 has seen all but product 5 of the first
+    events = [{'user_id': user, 'product_id': product, 'category': 'a'}
+              for user in range(2, 12) for product in range(1, 6)]
+    events += [{'user_id': user, 'product_id': product, 'category': 'b'}
+               for user in range(12, 22) for product in range(6, 11)]
+    events += [{'user_id': 1, 'product_id': product, 'category': 'a'} for product in range(1, 5)]
+    assert client.post('/ai/interactions/bulk', json=events, headers=headers).status_code == 201
+
+    als_model.train_model(factors=4, iterations=10)
+
+    recommended = als_model.recommend_for_user(1, 3)
+    assert recommended[0] == 5
+    assert not set(recommended) & {1, 2, 3, 4}
+    assert als_model.recommend_for_user('unknown', 3) == []
+    assert set(als_model.recommend_products(6, n_recommendations=4)) == {7, 8, 9, 10}
@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+from scipy.sparse import csr_matrix, random as sparse_random
+
+from app.config import Config
+from app.services import user_interaction_model
+from app.services.ann import RandomProjectionLSH
+from app.services.artifacts import load_artifact
+from app.services.similarity import top_k_similar
+from app.tests.test_interaction_model import post_events
+
+
+def clustered_vectors(n_groups=10, per_group=60, n_users=2000, seed=3):
+    # Products of a group are viewed by overlapping users, so true neighbors share a group
+    rng = np.random.default_rng(seed)
+    groups = []
+    for group in range(n_groups):
+        base = sparse_random(1, n_users, density=0.02, random_state=rng, dtype=np.float32).toarray()
+        noise = sparse_random(per_group, n_users, density=0.005, random_state=rng, dtype=np.float32).toarray()
+        groups.append(base + noise)
+    vectors = np.vstack(groups)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return csr_matrix(vectors)
+
+
+def test_lsh_recall_against_exact_search():
+    vectors = clustered_vectors()
+    rows = np.arange(vectors.shape[0])
+    exact, _ = top_k_similar(vectors, rows, 10, workers=1)
+    approximate, scores = RandomProjectionLSH(n_bits=8, n_tables=16).fit(vectors).query(rows, 10)
+
+    hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approximate, exact))
+    assert hits / (exact >= 0).sum() >= 0.9
+    assert not (approximate == rows[:, None]).any()
+    assert (np.diff(scores, axis=1) <= 1e-6).all()
+
+
+def test_lsh_hashes_are_stable_across_fits_and_blocks():
+    vectors = clustered_vectors(n_groups=3)
+    one = RandomProjectionLSH(block_rows=4096).fit(vectors)
+    blocked = RandomProjectionLSH(block_rows=7).fit(vectors)
+    assert (one._codes == blocked._codes).all()
+
+
+def test_small_catalogs_fall_back_to_exact_search(client, headers, monkeypatch):
+    post_events(client, headers, random.Random(5), 200)
+    user_interaction_model.train_model()
+    assert load_artifact(user_interaction_model.model_name).manifest['search'] == 'exact'
+
+    monkeypatch.setattr(Config, 'ANN_MIN_PRODUCTS', 1)
+    user_interaction_model.train_model(full=True)
+    assert load_artifact(user_interaction_model.model_name).manifest['search'] == 'lsh'
+    assert user_interaction_model.recommend_products(1, n_recommendations=5)
@@ -1 +1,188 @@
- 
+import json
+from datetime import datetime
+
+import mongomock
+from pymongo.errors import OperationFailure
+
+from app.models import interaction_counters, product_interactions
+from app.config import Config
+from app.services import plain_cat_model, user_interaction_model
+from app.tests.conftest import flask_app
+
+CATEGORIES = ['shoes red', 'shoes blue', 'hats wool', 'hats straw', 'bags']
+
+
+def post_interactions(client, headers, events):
+    return client.post('/ai/interactions/bulk', json=events, headers=headers)
+
+
+def seed_products(client, headers, count=20):
+    for product_id in range(1, count + 1):
+        client.post('/ai/products', json={'product_name': f'p{product_id}', 'product_id': product_id,
+                                          'category': CATEGORIES[product_id % 5]}, headers=headers)
+
+
+def test_bulk_interactions_status_codes(client, headers):
+    valid = {'user_id': 1, 'product_id': 2, 'category': 'bags'}
+
+    response = post_interactions(client, headers, [valid, valid])
+    assert response.status_code == 201
+    assert response.get_json() == {'inserted': 2, 'errors': []}
+
+    response = post_interactions(client, headers, [valid, {'user_id': 1}])
+    assert response.status_code == 207
+    assert response.get_json()['inserted'] == 1
+    assert [error['index'] for error in response.get_json()['errors']] == [1]
+
+    response = post_interactions(client, headers, [{'product_id': 2}])
+    assert response.status_code == 400
+    assert response.get_json()['inserted'] == 0
+
+    ndjson = '\n'.join([json.dumps(valid), 'not json'])
+    response = client.post('/ai/interactions/bulk', data=ndjson, headers=headers)
+    assert response.status_code == 207
+    assert response.get_json()['errors'] == [{'index': 1, 'error': 'invalid JSON'}]
+
+    assert client.post('/ai/interactions/bulk', data='', headers=headers).status_code == 400
+    assert interaction_counters.find_one({'user_id': 1, 'product_id': 2})['count'] == 4
+
+
+def test_category_recommendations_are_cached_with_etag(client, headers):
+    seed_products(client, headers)
+    plain_cat_model.train_model()
+
+    response = client.get('/ai/category-recommendations', query_string={'category': 'bags'})
+    assert response.status_code == 200
+    assert response.get_json()
+    etag = response.headers['ETag']
+
+    cached = client.get('/ai/category-recommendations', query_string={'category': 'bags'},
+                        headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+
+
+def test_interaction_listing_cursor_round_trip(client, headers):
+    # Bulk writes share created_at, so pages split on the _id tie-breaker
+    events = [{'user_id': user, 'product_id': product, 'category': 'bags'}
+              for user in range(1, 4) for product in range(1, 6)]
+    post_interactions(client, headers, events[:8])
+    post_interactions(client, headers, events[8:])
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/ai/interactions', query_string={'limit': 4, 'cursor': cursor}, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        seen.extend((doc['user_id'], doc['product_id']) for doc in page['interactions'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted((event['user_id'], event['product_id']) for event in events)
+    filtered = client.get('/ai/interactions', query_string={'user_id': '2'}, headers=headers).get_json()
+    assert {doc['user_id'] for doc in filtered['interactions']} == {2}
+    assert client.get('/ai/interactions', query_string={'cursor': 'bogus'}, headers=headers).status_code == 400
+
+    export = client.get('/ai/interactions', query_string={'format': 'ndjson'}, headers=headers)
+    assert export.mimetype == 'application/x-ndjson'
+    assert len(export.get_data().splitlines()) == len(events)
+
+
+def test_product_listing_hides_internal_fields(client, headers):
+    seed_products(client, headers, count=3)
+
+    products = client.get('/ai/products', headers=headers).get_json()['products']
+    assert [product['product_id'] for product in products] == [3, 2, 1]
+    assert set(products[0]) == {'product_id', 'product_name', 'category', 'created_at'}
+
+
+def test_single_interaction_rejects_unhashable_ids(client, headers):
+    response = client.post('/ai/interactions', json={'user_id': 1, 'product_id': {'x': 1}, 'category': 'a'},
+                           headers=headers)
+    assert response.status_code == 400
+    assert product_interactions.count_documents({}) == 0
+
+    response = client.post('/ai/interactions', json={'user_id': 1, 'product_id': 2, 'category': 'a'},
+                           headers=headers)
+    assert response.status_code == 201
+    assert interaction_counters.find_one({'user_id': 1, 'product_id': 2})['count'] == 1
+
+
+def test_listings_do_not_depend_on_their_indexes(client, headers, monkeypatch):
+    # MongoDB rejects a hint for an index that does not exist, mongomock ignores it
+    def missing_index(self, index):
+        raise OperationFailure('hint provided does not correspond to an existing index')
+    monkeypatch.setattr(mongomock.collection.Cursor, 'hint', missing_index)
+    post_interactions(client, headers, [{'user_id': 1, 'product_id': 2, 'category': 'bags'}])
+    seed_products(client, headers, count=1)
+
+    assert client.get('/ai/interactions', query_string={'user_id': 1}, headers=headers).status_code == 200
+    assert client.get('/ai/products', query_string={'product_id': 1}, headers=headers).status_code == 200
+
+
+def test_rebuild_counters_adds_a_window_without_replacing_counts(monkeypatch):
+    # mongomock has no $merge, check the pipeline the command sends
+    pipelines = []
+    monkeypatch.setattr(product_interactions, 'aggregate',
+                        lambda pipeline, **kwargs: pipelines.append(pipeline))
+
+    result = flask_app.test_cli_runner().invoke(args=[
+        'interactions', 'rebuild-counters', '--after', '2024-01-01', '--before', '2024-01-02'])
+    assert result.exit_code == 0, result.output
+
+    match, merge = pipelines[0][0]['$match'], pipelines[0][-1]['$merge']
+    assert match['created_at'] == {'$gte': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}
+    # Replacing would drop the views whose raw events the TTL index expired
+    assert merge['whenMatched'] != 'replace'
+    assert merge['whenMatched'][0]['$set']['count'] == {'$add': ['$count', '$$new.count']}
+
+
+def test_batch_recommendations_before_training_are_a_json_503(client):
+    response = client.post('/ai/recommendations/batch', json={'product_ids': [1], 'categories': ['bags']})
+    assert response.status_code == 503
+    assert 'Train the model first' in response.get_json()['error']
+
+
+def test_user_recommendations_before_training_are_a_json_503(client):
+    response = client.get('/ai/user-recommendations', query_string={'user_id': 1})
+    assert response.status_code == 503
+    assert 'Train the model first' in response.get_json()['error']
+
+
+def test_batch_recommendations_match_the_single_endpoints(client, headers):
+    seed_products(client, headers)
+    events = [{'user_id': user, 'product_id': product, 'category': CATEGORIES[product % 5]}
+              for user in range(1, 6) for product in range(user, user + 6)]
+    post_interactions(client, headers, events)
+    plain_cat_model.train_model()
+    user_interaction_model.train_model()
+
+    response = client.post('/ai/recommendations/batch', json={
+        'product_ids': [2, 99], 'categories': ['bags', 'hats wool'], 'limit': 3, 'fields': 'product_id'})
+    assert response.status_code == 200
+    batch = response.get_json()
+    assert batch['interaction']['2'] and batch['interaction']['99'] == []
+    assert set(batch['category']) == {'bags', 'hats wool'}
+
+    single = client.get('/ai/interaction-recommendations', query_string={
+        'product_id': 2, 'category': CATEGORIES[2], 'limit': 3, 'fields': 'product_id'}).get_json()
+    filtered = client.post('/ai/recommendations/batch', json={
+        'product_ids': [2], 'category': CATEGORIES[2], 'limit': 3, 'fields': 'product_id'}).get_json()
+    assert filtered['interaction']['2'] == single and single
+    single = client.get('/ai/category-recommendations', query_string={
+        'category': 'bags', 'limit': 3, 'fields': 'product_id'}).get_json()
+    assert batch['category']['bags'] == single and len(single) == 3
+
+
+def test_batch_recommendations_validate_the_body(client, monkeypatch):
+    def post(body):
+        return client.post('/ai/recommendations/batch', json=body).status_code
+
+    assert post([1, 2]) == 400
+    assert post({}) == 400
+    assert post({'product_ids': 1}) == 400
+    assert post({'categories': [{'name': 'bags'}]}) == 400
+    assert post({'categories': ['bags'], 'limit': 0}) == 400
+    assert post({'categories': ['bags'], 'fields': 'secret'}) == 400
+    monkeypatch.setattr(Config, 'BATCH_RECOMMENDATIONS_MAX', 2)
+    assert post({'product_ids': [1, 2], 'categories': ['bags']}) == 400
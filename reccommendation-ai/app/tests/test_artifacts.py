@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from app.services.artifacts import (save_artifact, load_artifact, current_version,
+                                    list_versions, rollback)
+
+
+def test_save_artifact_swaps_current_and_prunes_old_versions():
+    versions = [save_artifact('demo', {'values': np.arange(3) + i}, manifest={'run': i}, retention=2)
+                for i in range(4)]
+
+    assert current_version('demo') == versions[-1]
+    assert list_versions('demo') == versions[-2:]
+    artifact = load_artifact('demo')
+    assert artifact.manifest['run'] == 3
+    assert artifact['values'].tolist() == [3, 4, 5]
+
+
+def test_rollback_points_current_at_the_previous_version():
+    first = save_artifact('demo', {'values': np.zeros(2)})
+    save_artifact('demo', {'values': np.ones(2)})
+
+    assert rollback('demo') == first
+    assert current_version('demo') == first
+    with pytest.raises(ValueError):
+        rollback('demo')
@@ -0,0 +1,28 @@
+from app.models import product_collection
+from app.services.catalog import CatalogSnapshot
+from app.tests.test_app import seed_products
+
+
+def test_snapshot_hydrates_in_order_and_follows_writes(client, headers):
+    seed_products(client, headers, count=3)
+    snapshot = CatalogSnapshot(product_collection, refresh_interval=0)
+
+    assert [record['product_id'] for record in snapshot.get([3, 99, 1])] == [3, 1]
+    assert snapshot.get([2], ['product_name']) == [{'product_name': 'p2'}]
+
+    # A re-seeded product is picked up incrementally, a deleted one on the full reload
+    client.post('/ai/products', json={'product_name': 'renamed', 'product_id': 2, 'category': 'bags'},
+                headers=headers)
+    assert snapshot.get([2], ['product_name', 'category']) == [{'product_name': 'renamed', 'category': 'bags'}]
+    product_collection.delete_one({'product_id': 3})
+    assert snapshot.get([3, 1], ['product_id']) == [{'product_id': 1}]
+
+
+def test_snapshot_reads_unknown_ids_between_refreshes(client, headers):
+    seed_products(client, headers, count=1)
+    snapshot = CatalogSnapshot(product_collection, refresh_interval=3600)
+    assert len(snapshot.get([1])) == 1
+
+    seed_products(client, headers, count=2)
+    assert [record['product_id'] for record in snapshot.get([2, 1])] == [2, 1]
+    assert set(snapshot.get([2])[0]) == {'product_id', 'product_name', 'category', 'created_at'}
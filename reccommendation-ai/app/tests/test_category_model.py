@@ -0,0 +1,65 @@
+from sklearn.cluster import MiniBatchKMeans
+
+from app.services import plain_cat_model
+from app.services.artifacts import current_version
+
+CATEGORIES = ['shoes red', 'shoes blue', 'hats wool', 'hats straw', 'bags']
+
+
+def seed_product(client, headers, product_id, category):
+    response = client.post('/ai/products', json={'product_name': f'p{product_id}', 'product_id': product_id,
+                                                 'category': category}, headers=headers)
+    assert response.status_code == 201
+
+
+def page_through(category, limit):
+    pages, offset = [], 0
+    while True:
+        page = plain_cat_model.recommend_products(category, limit, offset)
+        if not page:
+            return pages
+        pages.append(page)
+        offset += limit
+
+
+def test_late_arrivals_follow_ranked_members_once(client, headers):
+    for product_id in range(1, 21):
+        seed_product(client, headers, product_id, CATEGORIES[product_id % 5])
+    plain_cat_model.train_model()
+    ranked = plain_cat_model.recommend_products('bags')
+
+    # A re-seeded member keeps its ranked place, new products follow it
+    seed_product(client, headers, ranked[0], 'bags')
+    for product_id in (21, 22, 23):
+        seed_product(client, headers, product_id, 'bags')
+
+    products = [product_id for page in page_through('bags', 2) for product_id in page]
+    assert products == ranked + [21, 22, 23]
+
+
+def test_grace_window_products_are_not_fitted_twice(client, headers, monkeypatch):
+    fitted = []
+    partial_fit = MiniBatchKMeans.partial_fit
+    def record(self, X, *args, **kwargs):
+        fitted.append(X.shape[0])
+        return partial_fit(self, X, *args, **kwargs)
+    monkeypatch.setattr(MiniBatchKMeans, 'partial_fit', record)
+
+    for product_id in range(1, 21):
+        seed_product(client, headers, product_id, CATEGORIES[product_id % 5])
+    plain_cat_model.train_model()
+    version = current_version(plain_cat_model.model_name)
+
+    # Every product is still inside the grace window but was fitted already
+    plain_cat_model.train_model()
+    assert fitted == []
+    assert current_version(plain_cat_model.model_name) == version
+
+    # Products written since that run are fitted once, later re-reads only re-place them
+    seed_product(client, headers, 21, 'hats wool')
+    seed_product(client, headers, 1, 'bags')
+    plain_cat_model.train_model()
+    assert fitted == [2]
+    plain_cat_model.train_model()
+    assert fitted == [2]
+    assert 1 in plain_cat_model.recommend_products('bags')
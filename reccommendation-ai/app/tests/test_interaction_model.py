@@ -0,0 +1,61 @@
+import random
+
+from app.services import user_interaction_model
+from app.services.artifacts import load_artifact
+
+
+def post_events(client, headers, rng, count, users=40, products=30):
+    events = [{'user_id': rng.randint(1, users), 'product_id': rng.randint(1, products),
+               'category': f'c{rng.randint(0, 2)}'} for _ in range(count)]
+    assert client.post('/ai/interactions/bulk', json=events, headers=headers).status_code == 201
+
+
+def checkpoint():
+    return user_interaction_model._load_checkpoint(user_interaction_model.model_name)
+
+
+def aligned_matrix(model, user_ids):
+    # User codes are assigned in arrival order, align the columns before comparing
+    codes = model['user_ids'].tolist()
+    return model['matrix'][:, [codes.index(user_id) for user_id in user_ids]]
+
+
+def test_incremental_interaction_model_matches_full_build(client, headers):
+    rng = random.Random(7)
+    post_events(client, headers, rng, 400)
+    user_interaction_model.train_model()
+
+    # New products and users, and more views of known pairs
+    post_events(client, headers, rng, 60, users=50, products=36)
+    user_interaction_model.train_model()
+    incremental = checkpoint()
+    assert load_artifact(user_interaction_model.model_name).manifest['mode'] == 'incremental'
+
+    user_interaction_model.train_model(full=True)
+    full = checkpoint()
+
+    assert incremental['product_ids'].tolist() == full['product_ids'].tolist()
+    assert incremental['product_categories'] == full['product_categories']
+    assert abs(aligned_matrix(incremental, full['user_ids'].tolist()) - full['matrix']).sum() == 0
+
+
+def test_category_partitions_find_neighbors_the_global_list_drops(client, headers):
+    # Product 1 ('a') shares its viewers with 30 'b' products, which fill its
+    # global top-20; products 2 and 3 ('a') share a single viewer with it
+    events = [{'user_id': user, 'product_id': product, 'category': 'b'}
+              for user in range(1, 11) for product in range(100, 130)]
+    events += [{'user_id': user, 'product_id': 1, 'category': 'a'} for user in range(1, 11)]
+    events += [{'user_id': 1, 'product_id': 2, 'category': 'a'}, {'user_id': 20, 'product_id': 2, 'category': 'a'},
+               {'user_id': 2, 'product_id': 3, 'category': 'a'}, {'user_id': 21, 'product_id': 3, 'category': 'a'}]
+    assert client.post('/ai/interactions/bulk', json=events, headers=headers).status_code == 201
+    user_interaction_model.train_model()
+
+    assert not {2, 3} & set(user_interaction_model.recommend_products(1, n_recommendations=20))
+    assert sorted(user_interaction_model.recommend_products(1, 'a', 20)) == [2, 3]
+    assert user_interaction_model.recommend_products(1, 'missing', 20) == []
+
+    # Several categories merge the own partition with the filtered global list by score
+    merged = user_interaction_model.recommend_products(1, 'b, a', 40)
+    assert len(merged) == len(set(merged)) == 22
+    assert set(merged[:20]) <= set(range(100, 130)) and sorted(merged[20:]) == [2, 3]
+    assert user_interaction_model.recommend_products(1, 'b,a', 5, offset=20) == merged[20:]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from app.services.artifacts import save_artifact, rollback, load_artifact
+from app.services.registry import ModelRegistry
+
+
+def test_registry_reloads_only_when_the_current_version_moves():
+    loads = []
+    def loader(name, version):
+        loads.append(version)
+        return load_artifact(name, version)
+    registry = ModelRegistry(loader=loader, check_interval=0)
+
+    with pytest.raises(FileNotFoundError):
+        registry.get('demo')
+
+    first = save_artifact('demo', {'values': np.zeros(2)})
+    assert registry.get('demo').version == first
+    assert registry.get('demo').version == first
+    assert loads == [first]
+
+    second = save_artifact('demo', {'values': np.ones(2)})
+    assert registry.get('demo')['values'].tolist() == [1, 1]
+    rollback('demo')
+    assert registry.get('demo').version == first
+    assert loads == [first, second, first]
+
+
+def test_registry_keeps_serving_when_a_reload_fails():
+    first = save_artifact('demo', {'values': np.zeros(2)})
+    broken = {'fail': False}
+    def loader(name, version):
+        if broken['fail']:
+            raise OSError('truncated artifact')
+        return load_artifact(name, version)
+    registry = ModelRegistry(loader=loader, check_interval=0)
+    assert registry.get('demo').version == first
+
+    broken['fail'] = True
+    save_artifact('demo', {'values': np.ones(2)})
+    assert registry.get('demo').version == first
+
+
+def test_registry_checks_the_pointer_at_most_once_per_interval():
+    first = save_artifact('demo', {'values': np.zeros(2)})
+    registry = ModelRegistry(check_interval=3600)
+    assert registry.get('demo').version == first
+
+    save_artifact('demo', {'values': np.ones(2)})
+    assert registry.get('demo').version == first
+    registry.invalidate('demo')
+    assert registry.get('demo').version != first
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+
+def test_serving_app_does_not_import_training_libraries():
+    # A fresh interpreter, the test process itself has trained models
+    script = textwrap.dedent('''
+        import sys
+        import fakeredis, flask_pymongo, mongomock
+        flask_pymongo.MongoClient = mongomock.MongoClient
+        import app
+        app.redis_client = fakeredis.FakeRedis()
+        app.create_app()
+        print(sorted({name.split('.')[0] for name in sys.modules} & {'scipy', 'sklearn', 'pandas'}))
+    ''')
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == '[]'
@@ -0,0 +1,53 @@
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+from app.services.similarity import top_k_similar, merge_changed_neighbors
+
+
+def normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return matrix.multiply(1 / norms[:, None]).tocsr().astype(np.float32)
+
+
+def random_matrix(n_products=300, n_users=400, seed=11):
+    return normalize(sparse_random(n_products, n_users, density=0.03, random_state=seed,
+                                   dtype=np.float32, format='csr'))
+
+
+def test_pool_and_serial_top_k_match_a_dense_reference():
+    normalized = random_matrix()
+    rows = np.arange(normalized.shape[0])
+    serial = top_k_similar(normalized, rows, 10, workers=1)
+    # A zero budget gives one row per block, spread over two processes
+    pooled = top_k_similar(normalized, rows, 10, workers=2, memory_budget_mb=0)
+
+    assert (serial[0] == pooled[0]).all() and np.allclose(serial[1], pooled[1])
+
+    dense = (normalized @ normalized.T).toarray()
+    np.fill_diagonal(dense, 0)
+    for row, (neighbors, scores) in enumerate(zip(*serial)):
+        expected = np.sort(dense[row][dense[row] > 0])[::-1][:10]
+        assert np.allclose(scores[neighbors >= 0], expected, atol=1e-6)
+
+
+def test_merging_changed_rows_matches_recomputing_them():
+    before = random_matrix()
+    changed = before.tolil()
+    affected = np.array([3, 50, 120])
+    rng = np.random.default_rng(2)
+    for row in affected:
+        changed[row, rng.choice(before.shape[1], 12, replace=False)] = rng.random(12)
+    after = normalize(changed.tocsr())
+
+    # Lists as long as the catalog, so no entry can have fallen out of an earlier top-k
+    top_k, rows = before.shape[0], np.arange(before.shape[0])
+    results = []
+    for workers in (1, 2):
+        neighbors, scores = top_k_similar(before, rows, top_k, workers=1)
+        neighbors[affected], scores[affected] = top_k_similar(after, affected, top_k, workers=1)
+        merge_changed_neighbors(after, neighbors, scores, affected, workers=workers, memory_budget_mb=0)
+        results.append((neighbors, scores))
+
+    assert (results[0][0] == results[1][0]).all() and np.allclose(results[0][1], results[1][1])
+    assert np.allclose(results[0][1], top_k_similar(after, rows, top_k, workers=1)[1], atol=1e-6)
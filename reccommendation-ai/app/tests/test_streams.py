@@ -0,0 +1,26 @@
+import json
+
+from app.models import product_interactions, interaction_counters
+from app.streams import process_batch
+
+
+def stream_entries(count):
+    return [(f'1-{i}'.encode(), {b'data': json.dumps({'user_id': 1, 'product_id': i % 2 + 1,
+                                                       'category': 'bags'}).encode()})
+            for i in range(count)]
+
+
+def test_invalid_stream_entries_are_dropped():
+    entries = stream_entries(2) + [(b'1-9', {b'data': b'not json'}), (b'1-10', {b'data': b'{"user_id": 1}'})]
+
+    assert process_batch(entries) == 2
+    assert product_interactions.count_documents({}) == 2
+
+
+def test_stream_redelivery_is_stored_and_counted_once():
+    entries = stream_entries(4)
+
+    assert process_batch(entries) == 4
+    assert process_batch(entries) == 0
+    assert product_interactions.count_documents({}) == 4
+    assert sum(counter['count'] for counter in interaction_counters.find()) == 4